@@ -0,0 +1 @@
+"""梅花易数排盘核心库：与 Streamlit 界面解耦，可被脚本、服务和批处理直接导入。"""
@@ -0,0 +1,165 @@
+"""
+无界面 HTTP API（ASGI / Starlette），与 Streamlit 界面共用同一套起卦、八字与提示词模块。
+
+    python -m meihua.api --host 0.0.0.0 --port 8000
+    uvicorn meihua.api:app --workers 4
+
+接口（请求体均为 JSON）：
+- POST /v1/cast       起卦：{"method": "number", "num1", "num2"} 或 {"method": "time", "date", "time"}，
+                      返回排盘结果与本地断语（体用生克、旺衰、应期）
+- POST /v1/bazi       八字：{"year", "month", "day", "hour", "minute", "birth_place"}
+- POST /v1/interpret  解读：起卦参数 + {"question", "model", "birth": {...}, "mode": "standard", "stream": true}
+                      model 须在 MEIHUA_API_MODELS 之内（缺省 MEIHUA_API_DEFAULT_MODEL），否则返回 400；
+                      mode 为 standard（深度，自适应思考预算）或 fast（快速，不思考、精简输出）；
+                      stream 为 true（默认）时返回 SSE：cast / delta / usage / done / error 事件；
+                      否则等解读完成后返回一个 JSON。
+- GET  /metrics       Prometheus 文本格式指标
+- GET  /healthz
+
+上游流式请求全部走 AsyncOpenAI 与协程准入队列，等待中的连接不占线程。
+"""
+import argparse
+import json
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from . import metrics, scheduler, service, settings, singleflight
+
+_scheduler = None
+
+
+def get_scheduler():
+    """API 进程自己的准入调度器，排队上限按协程并发设置"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = scheduler.AdmissionScheduler(queue_max=settings.API_QUEUE_MAX)
+    return _scheduler
+
+
+def _error(status, message, code):
+    return JSONResponse({"error": {"message": message, "code": code}}, status_code=status)
+
+
+def _error_status(exc):
+    """异常 -> (HTTP 状态码, 错误码)"""
+    if isinstance(exc, service.RequestError):
+        return 400, "invalid_request"
+    if isinstance(exc, scheduler.QueueFullError):
+        return 503, "queue_full"
+    if isinstance(exc, scheduler.QueueTimeoutError):
+        return 503, "queue_timeout"
+    if scheduler.is_rate_limited(exc):
+        return 429, "rate_limited"
+    return 502, "upstream_error"
+
+
+def _authorized(request):
+    if not settings.API_TOKEN:
+        return True
+    return request.headers.get("authorization", "") == f"Bearer {settings.API_TOKEN}"
+
+
+async def _read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise service.RequestError("请求体须为 JSON 对象") from None
+    if not isinstance(body, dict):
+        raise service.RequestError("请求体须为 JSON 对象")
+    return body
+
+
+def endpoint(handler):
+    """统一鉴权与参数错误处理"""
+    async def wrapped(request):
+        if not _authorized(request):
+            return _error(401, "未授权", "unauthorized")
+        try:
+            return await handler(request)
+        except service.RequestError as e:
+            return _error(400, str(e), "invalid_request")
+    return wrapped
+
+
+@endpoint
+async def cast(request):
+    body = await _read_json(request)
+    method, res, qigua_info, verdict = service.cast_from_params(body)
+    return JSONResponse({"method": method, "qigua_info": qigua_info, "result": res, "verdict": verdict})
+
+
+@endpoint
+async def bazi(request):
+    body = await _read_json(request)
+    return JSONResponse(service.bazi_from_params(body))
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse(prepared):
+    try:
+        async for event, data in service.interpret(prepared, sched=get_scheduler()):
+            yield sse_event(event, data)
+    except Exception as e:
+        # 响应头已发出，错误只能作为事件告知客户端
+        status, code = _error_status(e)
+        yield sse_event("error", {"message": str(e), "code": code, "status": status})
+
+
+@endpoint
+async def interpret(request):
+    body = await _read_json(request)
+    prepared = service.prepare(body)
+    if body.get("stream", True):
+        return StreamingResponse(_sse(prepared), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    payload, pieces = {}, []
+    try:
+        async for event, data in service.interpret(prepared, sched=get_scheduler()):
+            if event == "delta":
+                pieces.append(data["text"])
+            else:
+                payload.update(data if event != "usage" else {"usage": data})
+    except Exception as e:
+        status, code = _error_status(e)
+        return _error(status, str(e), code)
+    payload["text"] = "".join(pieces)
+    return JSONResponse(payload)
+
+
+async def metrics_text(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok", "scheduler": get_scheduler().stats(),
+                         "singleflight": singleflight.get_async_flights().stats()})
+
+
+app = Starlette(routes=[
+    Route("/v1/cast", cast, methods=["POST"]),
+    Route("/v1/bazi", bazi, methods=["POST"]),
+    Route("/v1/interpret", interpret, methods=["POST"]),
+    Route("/metrics", metrics_text, methods=["GET"]),
+    Route("/healthz", healthz, methods=["GET"]),
+])
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="梅花易数 HTTP API")
+    parser.add_argument("--host", default=settings.API_HOST)
+    parser.add_argument("--port", type=int, default=settings.API_PORT)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+    uvicorn.run("meihua.api:app" if args.workers > 1 else app, host=args.host, port=args.port,
+                workers=args.workers, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
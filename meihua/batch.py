@@ -0,0 +1,180 @@
+"""
+离线批量解读：读取 JSONL / CSV 中的问题、起卦参数与生辰，本地起卦后以有限并发调用大模型，
+结果逐行追加写入输出 JSONL。每完成一行即记入检查点文件，中断后重跑会跳过已完成的行。
+
+    python -m meihua.batch questions.csv -o readings.jsonl --concurrency 8
+
+输入字段（JSONL 每行一个对象，CSV 为表头）：
+  id（缺省为行号）、question、method（number / time）、num1、num2、date、time、model、mode（standard / fast）、
+  birth（JSONL 中的对象）或 birth_year / birth_month / birth_day / birth_hour / birth_minute / birth_place
+输出每行：id、status（ok / error）、排盘结果、八字、模型、解读全文、用量与耗时；失败行不记检查点，
+重跑时会再次尝试（同一 id 以最后一行为准）。
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+
+from . import policy, scheduler, service, settings
+
+BIRTH_FIELDS = ("year", "month", "day", "hour", "minute", "birth_place")
+
+
+def read_rows(path):
+    """产出 (row_id, row)；空行与无法解析的行跳过"""
+    if path.lower().endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            for i, row in enumerate(csv.DictReader(f), 1):
+                row = {k.strip(): v.strip() for k, v in row.items() if k and v not in (None, "")}
+                yield str(row.get("id") or i), row
+        return
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                print(f"第 {i} 行不是合法 JSON，已跳过", file=sys.stderr)
+                continue
+            yield str(row.get("id") or i), row
+
+
+def row_params(row):
+    """扁平的 birth_* 字段合并为 service 需要的 birth 对象"""
+    params = {k: v for k, v in row.items() if not k.startswith("birth_")}
+    if not params.get("birth"):
+        birth = {}
+        for field in BIRTH_FIELDS:
+            key = field if field == "birth_place" else f"birth_{field}"
+            if row.get(key) not in (None, ""):
+                birth[field] = row[key]
+        params["birth"] = birth or None
+    return params
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class _Writer:
+    """输出与检查点都按行追加并立即刷盘：先写结果，再记检查点"""
+
+    def __init__(self, output_path, checkpoint_path):
+        self._out = open(output_path, "a", encoding="utf-8")
+        self._ckpt = open(checkpoint_path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self._out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        if record["status"] == "ok":
+            self._ckpt.write(record["id"] + "\n")
+            self._ckpt.flush()
+            os.fsync(self._ckpt.fileno())
+
+    def close(self):
+        self._out.close()
+        self._ckpt.close()
+
+
+async def run_row(row_id, row, sched, thinking_budget=None, mode=None):
+    start = time.perf_counter()
+    record = {"id": row_id, "status": "ok"}
+    pieces = []
+    try:
+        params = row_params(row)
+        # 行内未指定解读模式时用命令行的 --mode
+        if mode and not params.get("mode"):
+            params["mode"] = mode
+        prepared = service.prepare(params)
+        record["question"] = prepared["question"]
+        async for event, data in service.interpret(prepared, sched=sched, thinking_budget=thinking_budget):
+            if event == "delta":
+                pieces.append(data["text"])
+            elif event == "usage":
+                record["usage"] = data
+            else:
+                record.update(data)
+        record["text"] = "".join(pieces)
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+async def run_batch(input_path, output_path, checkpoint_path=None, concurrency=4, limit=None,
+                    thinking_budget=None, progress=None, mode=None):
+    """返回 {"total", "skipped", "ok", "error"}"""
+    checkpoint_path = checkpoint_path or output_path + ".done"
+    done = load_checkpoint(checkpoint_path)
+    rows = []
+    skipped = 0
+    for row_id, row in read_rows(input_path):
+        if row_id in done:
+            skipped += 1
+            continue
+        rows.append((row_id, row))
+        if limit and len(rows) >= limit:
+            break
+
+    counts = {"total": len(rows), "skipped": skipped, "ok": 0, "error": 0}
+    if not rows:
+        return counts
+    # 并发由固定数量的 worker 控制（各自从同一迭代器取下一行），调度器只负责令牌桶与流配额，
+    # 队列上限放宽到不拒绝批处理请求
+    sched = scheduler.AdmissionScheduler(queue_max=max(concurrency, settings.LLM_QUEUE_MAX),
+                                         queue_timeout=max(settings.LLM_QUEUE_TIMEOUT, 600))
+    writer = _Writer(output_path, checkpoint_path)
+    pending = iter(rows)
+
+    async def worker():
+        for row_id, row in pending:
+            record = await run_row(row_id, row, sched, thinking_budget, mode)
+            writer.write(record)
+            counts[record["status"]] += 1
+            if progress is not None:
+                progress(counts, record)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(max(concurrency, 1), len(rows)))))
+    finally:
+        writer.close()
+    return counts
+
+
+def _print_progress(counts, record):
+    finished = counts["ok"] + counts["error"]
+    detail = "" if record["status"] == "ok" else f"  {record.get('error', '')[:80]}"
+    print(f"[{finished}/{counts['total']}] {record['id']} {record['status']} {record['elapsed']}s{detail}",
+          file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="梅花易数批量解读")
+    parser.add_argument("input", help="输入文件（.jsonl 或 .csv）")
+    parser.add_argument("-o", "--output", required=True, help="输出 JSONL（追加写入）")
+    parser.add_argument("--checkpoint", help="检查点文件，默认 <output>.done")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的解读数")
+    parser.add_argument("--limit", type=int, help="本次最多处理的行数")
+    parser.add_argument("--thinking-budget", type=int, help="固定思考预算，覆盖按请求自适应的预算")
+    parser.add_argument("--mode", choices=policy.MODES, help="行内未指定 mode 时的解读模式，缺省为深度")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    counts = asyncio.run(run_batch(args.input, args.output, args.checkpoint, args.concurrency, args.limit,
+                                   args.thinking_budget, progress=_print_progress, mode=args.mode))
+    print(f"完成 {counts['ok']}，失败 {counts['error']}，跳过已完成 {counts['skipped']}，"
+          f"耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
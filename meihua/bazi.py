@@ -0,0 +1,187 @@
+"""
+八字排盘与命理细节提取。
+
+同一出生分钟的 getLunar() / getBaZi() / getDaYun() 结果在进程内按 LRU + TTL 缓存，
+Streamlit 每次重跑与多次起卦不再重复推算；大运按当前公历年分键，流年走农历索引查表。
+
+会话里只保存 compact_birth() 的紧凑记录（出生分钟 + 八字串 + 出生地），
+Solar 对象与命理细节按出生分钟从进程缓存取用，淘汰后再按需重建。
+"""
+import datetime
+
+from lunar_python import Solar
+
+from . import lunar_index, settings
+from .cache import LRUCache
+
+# 出生分钟 -> (八字串, 公历串, Solar)
+_chart_cache = LRUCache(settings.BAZI_CACHE_SIZE, settings.BAZI_CACHE_TTL)
+# (出生分钟, 当前年) -> 命理细节（不含流年）
+_detail_cache = LRUCache(settings.BAZI_CACHE_SIZE, settings.BAZI_CACHE_TTL)
+
+UNKNOWN_DETAIL = {
+    "day_zhu": "未知", "day_wuxing": "未知", "shi_shen_str": "未知",
+    "month_wuxing": "未知", "da_yun_ganzhi": "未知", "da_yun_nayin": "未知",
+    "liu_nian_ganzhi": "未知", "tao_hua": "未知", "tian_yi": "未知"
+}
+
+TIAN_GAN_WUXING = {
+    "甲": "木", "乙": "木", "丙": "火", "丁": "火",
+    "戊": "土", "己": "土", "庚": "金", "辛": "金",
+    "壬": "水", "癸": "水"
+}
+
+DI_ZHI_WUXING = {
+    '子': '水', '丑': '土', '寅': '木', '卯': '木',
+    '辰': '土', '巳': '火', '午': '火', '未': '土',
+    '申': '金', '酉': '金', '戌': '土', '亥': '水'
+}
+
+
+def birth_key(solar):
+    """Solar 对象 -> 出生分钟键"""
+    return solar.getYear(), solar.getMonth(), solar.getDay(), solar.getHour(), solar.getMinute()
+
+
+def _compute_bazi(year, month, day, hour, minute):
+    try:
+        solar = Solar.fromYmdHms(year, month, day, hour, minute, 0)
+        lunar = solar.getLunar()
+        ba_zi_str = f"{lunar.getYearInGanZhi()}年 {lunar.getMonthInGanZhi()}月 {lunar.getDayInGanZhi()}日 {lunar.getTimeInGanZhi()}时"
+        solar_str = format_solar((year, month, day, hour, minute))
+        return ba_zi_str, solar_str, solar  # 返回 solar 对象以便后续提取更多信息
+    except Exception as e:
+        return f"计算出错: {str(e)}", "", None
+
+
+def calculate_bazi(year, month, day, hour, minute):
+    key = (year, month, day, hour, minute)
+    return _chart_cache.get_or_compute(key, lambda: _compute_bazi(*key))
+
+
+def compact_birth(year, month, day, hour, minute, birth_place=""):
+    """会话内保存的命主记录 {"key"（出生分钟）, "bazi", "place"}；排盘出错时返回 None"""
+    ba_zi_str, _, solar = calculate_bazi(year, month, day, hour, minute)
+    if solar is None:
+        return None
+    return {"key": (year, month, day, hour, minute), "bazi": ba_zi_str, "place": birth_place}
+
+
+def format_solar(key):
+    """出生分钟 -> 公历串"""
+    return "{:04d}-{:02d}-{:02d} {:02d}:{:02d}".format(*key)
+
+
+def birth_solar(key):
+    """按出生分钟取 Solar 对象（进程缓存，未命中时重建）"""
+    return calculate_bazi(*key)[2]
+
+
+def _compute_detail(solar, current_year):
+    """提取与出生时间、当前年份相关的命理信息（流年单独计算）"""
+    lunar = solar.getLunar()
+    ba_zi = lunar.getBaZi()
+
+    # ---------- 日主天干和五行 ----------
+    day_ganzhi = lunar.getDayInGanZhi()  # 如 "甲子"
+    day_zhu = day_ganzhi[0] if day_ganzhi and len(day_ganzhi) >= 1 else "未知"
+    day_wuxing = TIAN_GAN_WUXING.get(day_zhu, "未知")
+
+    # ---------- 十神 ----------
+    try:
+        shi_shen_list = ba_zi.getShiShen()  # 某些版本可能存在此方法
+    except AttributeError:
+        shi_shen_list = []
+    # 确保至少有4个元素
+    shi_shen_list = list(shi_shen_list)
+    while len(shi_shen_list) < 4:
+        shi_shen_list.append("未知")
+    shi_shen_str = "年干{}、月干{}、日支{}、时干{}".format(*shi_shen_list[:4])
+
+    # ---------- 月令五行 ----------
+    month_ganzhi = lunar.getMonthInGanZhi()
+    month_zhi = month_ganzhi[-1] if month_ganzhi and len(month_ganzhi) >= 2 else "子"
+    month_wuxing = DI_ZHI_WUXING.get(month_zhi, "未知")
+
+    # ---------- 大运 ----------
+    try:
+        da_yun_list = lunar.getDaYun()
+    except AttributeError:
+        da_yun_list = []
+    current_da_yun = None
+    for dy in da_yun_list:
+        if hasattr(dy, 'getStartYear') and hasattr(dy, 'getEndYear'):
+            if dy.getStartYear() <= current_year <= dy.getEndYear():
+                current_da_yun = dy
+                break
+    if current_da_yun:
+        da_yun_ganzhi = current_da_yun.getGanZhi() if hasattr(current_da_yun, 'getGanZhi') else "未知"
+        da_yun_nayin = current_da_yun.getNaYin() if hasattr(current_da_yun, 'getNaYin') else "未知"
+    else:
+        da_yun_ganzhi = "未知"
+        da_yun_nayin = "未知"
+
+    # ---------- 神煞 ----------
+    try:
+        shen_sha = ba_zi.getShenSha() or {}
+    except AttributeError:
+        shen_sha = {}
+    tao_hua = shen_sha.get('桃花', '无')
+    tian_yi = shen_sha.get('天乙贵人', '无')
+
+    return {
+        "day_zhu": day_zhu,
+        "day_wuxing": day_wuxing,
+        "shi_shen_str": shi_shen_str,
+        "month_wuxing": month_wuxing,
+        "da_yun_ganzhi": da_yun_ganzhi,
+        "da_yun_nayin": da_yun_nayin,
+        "tao_hua": tao_hua,
+        "tian_yi": tian_yi,
+    }
+
+
+def liu_nian_ganzhi(now):
+    """当前时刻的流年干支（农历年），优先查农历索引"""
+    rec = lunar_index.lookup(now.date(), now.hour)
+    if rec is not None:
+        return lunar_index.GANZHI[rec["year_gz"]]
+    return Solar.fromDate(now).getLunar().getYearInGanZhi() or "未知"
+
+
+def _detail(key, get_solar, now):
+    try:
+        now = now or datetime.datetime.now()
+        detail = _detail_cache.get_or_compute(key + (now.year,), lambda: _compute_detail(get_solar(), now.year))
+        # ---------- 流年 ----------
+        return dict(detail, liu_nian_ganzhi=liu_nian_ganzhi(now))
+    except Exception:
+        # 任何意外错误返回默认值
+        return dict(UNKNOWN_DETAIL)
+
+
+def get_bazi_detail(solar, now=None):
+    """从 Solar 对象中提取命理信息，兼容不同版本的 lunar-python"""
+    if solar is None:
+        return dict(UNKNOWN_DETAIL)
+    return _detail(birth_key(solar), lambda: solar, now)
+
+
+def get_birth_detail(key, now=None):
+    """按出生分钟取命理信息；命中缓存时不构造 Solar 对象"""
+    return _detail(tuple(key), lambda: birth_solar(key), now)
+
+
+def configure_cache(maxsize=None, ttl=None):
+    """运行时调整两级缓存的容量与 TTL"""
+    _chart_cache.resize(maxsize, ttl)
+    _detail_cache.resize(maxsize, ttl)
+
+
+def clear_cache():
+    _chart_cache.clear()
+    _detail_cache.clear()
+
+
+def cache_stats():
+    return {"chart": _chart_cache.stats(), "detail": _detail_cache.stats()}
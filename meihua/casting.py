@@ -0,0 +1,53 @@
+"""
+起卦入口：数字起卦 / 时间起卦 -> 排盘结果与"起卦机缘"说明，供界面、API 与批处理共用。
+"""
+import datetime
+
+from lunar_python import Solar
+
+from . import gua, lunar_index
+
+METHOD_NUMBER = "number"
+METHOD_TIME = "time"
+
+
+def get_beijing_time():
+    utc_now = datetime.datetime.utcnow()
+    return utc_now + datetime.timedelta(hours=8)
+
+
+def get_time_gua_numbers(date_obj, time_obj):
+    # 优先走预计算农历索引（1900-2100，O(1) 查表），超出范围时回退到 lunar_python
+    indexed = lunar_index.time_gua_numbers(date_obj, time_obj.hour)
+    if indexed is not None:
+        return indexed
+    return lunar_time_gua_numbers(date_obj, time_obj)
+
+
+def lunar_time_gua_numbers(date_obj, time_obj):
+    """直接用 lunar_python 推算时间起卦数（索引范围外的回退路径，也用作基准对照）"""
+    solar = Solar.fromYmdHms(date_obj.year, date_obj.month, date_obj.day, time_obj.hour, time_obj.minute, 0)
+    lunar = solar.getLunar()
+
+    dz_list = ["子", "丑", "寅", "卯", "辰", "巳", "午", "未", "申", "酉", "戌", "亥"]
+    year_num = dz_list.index(lunar.getYearZhi()) + 1
+    month_num = abs(lunar.getMonth())
+    day_num = lunar.getDay()
+    hour_num = dz_list.index(lunar.getTimeZhi()) + 1
+
+    lunar_info = f"农历：{lunar.getYearInGanZhi()}年 {lunar.getMonthInChinese()}月 {lunar.getDayInChinese()} {lunar.getTimeInGanZhi()}时"
+    return year_num, month_num, day_num, hour_num, lunar_info
+
+
+def cast_by_numbers(num1, num2):
+    """数字起卦，返回 (gua.cast 结果, 起卦机缘说明)"""
+    res = gua.cast(*gua.number_to_trigrams(num1, num2))
+    return res, f"【数字起卦】上数：{num1}，下数：{num2}"
+
+
+def cast_by_time(date_obj, time_obj):
+    """时间起卦（北京时间），返回 (gua.cast 结果, 起卦机缘说明)"""
+    y_n, m_n, d_n, h_n, lunar_str = get_time_gua_numbers(date_obj, time_obj)
+    shang_num, xia_num, dong_yao = gua.time_to_trigrams(y_n, m_n, d_n, h_n)
+    qigua_info = f"【时间起卦】{lunar_str} <br>(年{y_n}+月{m_n}+日{d_n}=上卦{shang_num}，加时{h_n}=下卦{xia_num}/动爻{dong_yao})"
+    return gua.cast(shang_num, xia_num, dong_yao), qigua_info
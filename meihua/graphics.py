@@ -0,0 +1,85 @@
+"""
+卦象图形：64 卦 × (无动爻 + 6 个动爻高亮) 共 448 个内联 SVG 在导入时一次性生成。
+
+排盘结果（本卦、互卦、变卦三块面板与信息摘要框）拼成一段 HTML，由界面一次输出，
+取代逐爻逐标题的多次 st.markdown 调用。
+"""
+from .gua import GUA_DATA, hexagram_bits, hexagram_trigrams
+
+INK = "#2c3e50"         # 水墨黑
+CINNABAR = "#e74c3c"    # 朱砂红（动爻）
+
+# 每爻占 36 单位高：爻体 16，上下留白各 10，与原 .yao-container 的比例一致
+_YAO_PITCH = 36
+_YAO_HEIGHT = 16
+_VIEW_W = 100
+_VIEW_H = _YAO_PITCH * 6
+
+
+def _yao_svg(is_yang, y, moving):
+    fill = CINNABAR if moving else INK
+    if is_yang:
+        return f"<rect x='10' y='{y}' width='80' height='{_YAO_HEIGHT}' rx='4' fill='{fill}'/>"
+    return (f"<rect x='10' y='{y}' width='35.2' height='{_YAO_HEIGHT}' rx='4' fill='{fill}'/>"
+            f"<rect x='54.8' y='{y}' width='35.2' height='{_YAO_HEIGHT}' rx='4' fill='{fill}'/>")
+
+
+def _hexagram_svg(hid, moving):
+    bits = hexagram_bits(hid)
+    parts = []
+    # 自上而下绘制：第 6 爻在最上方
+    for row, i in enumerate(range(5, -1, -1)):
+        y = row * _YAO_PITCH + (_YAO_PITCH - _YAO_HEIGHT) // 2
+        parts.append(_yao_svg(bits[i] == 1, y, moving == i + 1))
+    return (f"<svg class='gua-svg' viewBox='0 0 {_VIEW_W} {_VIEW_H}' preserveAspectRatio='none' "
+            f"xmlns='http://www.w3.org/2000/svg' role='img'>{''.join(parts)}</svg>")
+
+
+# (重卦编号, 动爻 0~6) -> SVG；动爻 0 表示无高亮
+HEXAGRAM_SVG = {(hid, moving): _hexagram_svg(hid, moving) for hid in range(64) for moving in range(7)}
+
+
+def hexagram_panel(label, hid, moving=0):
+    shang, xia = hexagram_trigrams(hid)
+    return (f"<div class='gua-panel'><div class='gua-title'>{label}<br>"
+            f"<span style='font-size:0.7em;color:#7f8c8d'>{GUA_DATA[shang]['name']}{GUA_DATA[xia]['name']}</span></div>"
+            f"{HEXAGRAM_SVG[(hid, moving)]}</div>")
+
+
+def verdict_html(verdict):
+    """rules.judge() 的断语摘要，接在信息框末尾"""
+    short, medium, long_ = (t["adjusted"] for t in verdict["timing"])
+    return (
+        f"<br><b>⚖️ 体用断语：</b>{verdict['relation']}（{verdict['grade']}），{verdict['dong_note']}"
+        f" → <b>{verdict['adjusted_grade']}</b>；变卦{verdict['bian_relation']}（{verdict['bian_grade']}），"
+        f"<b>{verdict['trend']}</b><br>"
+        f"<b>🌙 月令旺衰：</b>{verdict['month_zhi']}月{verdict['season_wx']}当令，"
+        f"体{verdict['ti_state']} · 用{verdict['yong_state']} · 变{verdict['bian_state']}<br>"
+        f"<b>⏳ 应期：</b>{verdict['timing_note']}，短期约 {short} / 中期约 {medium} / 长期约 {long_}；"
+        f"吉日 {verdict['lucky_days']}，忌日 {verdict['unlucky_days']}"
+    )
+
+
+def render_result_html(res, qigua_info, verdict=None):
+    """
+    res 为 gua.cast() 的返回值，verdict 为 rules.judge() 的返回值（可省略），
+    返回含标题、三卦面板与信息摘要框的完整 HTML
+    """
+    dong_yao = res["dong_yao"]
+    ti_gua, yong_gua, bian_res_gua = res["ti_gua"], res["yong_gua"], res["bian_res_gua"]
+    # 整段不换行不缩进，避免 Markdown 把缩进行当作代码块
+    return (
+        "<hr><h3>排盘结果</h3>"
+        "<div class='gua-row'>"
+        f"{hexagram_panel('本卦', res['ben_id'], dong_yao)}"
+        f"{hexagram_panel('互卦', res['hu_id'])}"
+        "<div class='gua-arrow'>➜</div>"
+        f"{hexagram_panel('变卦', res['bian_id'], dong_yao)}"
+        "</div>"
+        "<div class='info-box'>"
+        f"<b>📋 起卦机缘：</b>{qigua_info}<br>"
+        f"<b>🎯 核心体用：</b>体卦为主（<b>{ti_gua['name']}{ti_gua['wx']}</b>） | 用卦为客（<b>{yong_gua['name']}{yong_gua['wx']}</b>）<br>"
+        f"<b>✨ 变化之机：</b>第 <b>{dong_yao}</b> 爻发动，变出 <b>{bian_res_gua['name']}{bian_res_gua['wx']}</b>"
+        f"{verdict_html(verdict) if verdict else ''}"
+        "</div>"
+    )
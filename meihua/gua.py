@@ -0,0 +1,168 @@
+"""
+卦象引擎：本卦 / 互卦 / 变卦与体用的查表计算。
+
+64 卦 × 6 动爻共 384 种状态在导入时一次性预计算为紧凑的查找表，
+单次起卦只做几次下标访问；批量接口基于 numpy 向量化，一次处理整批历史卦例。
+
+编号约定：
+- 经卦编号 1~8 沿用 GUA_DATA（乾兑离震巽坎艮坤，先天数）。
+- 重卦编号 hid = (上卦 - 1) * 8 + (下卦 - 1)，取值 0~63。
+- 爻位自下而上为 1~6，binary 列表同样自下而上排列。
+"""
+import numpy as np
+
+# ================= 基础数据 (八卦属性) =================
+GUA_DATA = {
+    1: {"name": "乾", "wx": "金", "binary": [1, 1, 1]},
+    2: {"name": "兑", "wx": "金", "binary": [1, 1, 0]},
+    3: {"name": "离", "wx": "火", "binary": [1, 0, 1]},
+    4: {"name": "震", "wx": "木", "binary": [1, 0, 0]},
+    5: {"name": "巽", "wx": "木", "binary": [0, 1, 1]},
+    6: {"name": "坎", "wx": "水", "binary": [0, 1, 0]},
+    7: {"name": "艮", "wx": "土", "binary": [0, 0, 1]},
+    8: {"name": "坤", "wx": "土", "binary": [0, 0, 0]},
+}
+
+
+# ================= 预计算查找表 =================
+def _trigram_mask(bits):
+    # binary 自下而上，最下一爻为最低位
+    return bits[0] | (bits[1] << 1) | (bits[2] << 2)
+
+
+# 经卦编号 -> 3 位掩码；3 位掩码 -> 经卦编号
+TRIGRAM_MASK = [0] * 9
+MASK_TRIGRAM = [8] * 8
+for _gid, _data in GUA_DATA.items():
+    TRIGRAM_MASK[_gid] = _trigram_mask(_data["binary"])
+    MASK_TRIGRAM[TRIGRAM_MASK[_gid]] = _gid
+
+
+def hexagram_id(shang, xia):
+    """由上下经卦编号 (1~8) 得到重卦编号 (0~63)"""
+    return (shang - 1) * 8 + (xia - 1)
+
+
+def hexagram_trigrams(hid):
+    """由重卦编号拆回 (上卦, 下卦)"""
+    return hid // 8 + 1, hid % 8 + 1
+
+
+def hexagram_bits(hid):
+    """重卦六爻列表（自下而上，1 为阳）"""
+    shang, xia = hexagram_trigrams(hid)
+    return GUA_DATA[xia]["binary"] + GUA_DATA[shang]["binary"]
+
+
+def _build_tables():
+    hu = [0] * 64
+    bian = [[0] * 6 for _ in range(64)]
+    for hid in range(64):
+        shang, xia = hexagram_trigrams(hid)
+        mask = TRIGRAM_MASK[xia] | (TRIGRAM_MASK[shang] << 3)
+        # 互卦：二三四爻为下互，三四五爻为上互
+        hu[hid] = hexagram_id(MASK_TRIGRAM[(mask >> 2) & 7], MASK_TRIGRAM[(mask >> 1) & 7])
+        for d in range(6):
+            b = mask ^ (1 << d)
+            bian[hid][d] = hexagram_id(MASK_TRIGRAM[(b >> 3) & 7], MASK_TRIGRAM[b & 7])
+    return hu, bian
+
+
+HU_TABLE, BIAN_TABLE = _build_tables()
+
+# numpy 版本供批量接口使用（uint8，整表不足 1KB）
+HU_ARRAY = np.array(HU_TABLE, dtype=np.uint8)
+BIAN_ARRAY = np.array(BIAN_TABLE, dtype=np.uint8)
+
+
+# ================= 单次起卦 =================
+def number_to_trigrams(num1, num2):
+    """数字起卦：上数、下数 -> (上卦, 下卦, 动爻)"""
+    return num1 % 8 or 8, num2 % 8 or 8, (num1 + num2) % 6 or 6
+
+
+def time_to_trigrams(year_num, month_num, day_num, hour_num):
+    """时间起卦：年支数 + 农历月 + 农历日 (+ 时支数) -> (上卦, 下卦, 动爻)"""
+    sum_shang = year_num + month_num + day_num
+    sum_xia = sum_shang + hour_num
+    return sum_shang % 8 or 8, sum_xia % 8 or 8, sum_xia % 6 or 6
+
+
+def cast(shang, xia, dong_yao):
+    """
+    由上卦、下卦、动爻得到完整排盘结果。
+    返回的卦名/五行均为 GUA_DATA 中的原始字典，便于界面与提示词直接使用。
+    """
+    ben = hexagram_id(shang, xia)
+    hu = HU_TABLE[ben]
+    bian = BIAN_TABLE[ben][dong_yao - 1]
+    hu_shang, hu_xia = hexagram_trigrams(hu)
+    bian_shang, bian_xia = hexagram_trigrams(bian)
+
+    # 动爻在上卦则下卦为体，否则上卦为体；体卦所对的变卦经卦为结局
+    if dong_yao > 3:
+        ti, yong, bian_res = xia, shang, bian_shang
+    else:
+        ti, yong, bian_res = shang, xia, bian_xia
+
+    return {
+        "ben_id": ben, "hu_id": hu, "bian_id": bian, "dong_yao": dong_yao,
+        "ben_shang": GUA_DATA[shang], "ben_xia": GUA_DATA[xia],
+        "hu_shang": GUA_DATA[hu_shang], "hu_xia": GUA_DATA[hu_xia],
+        "bian_shang": GUA_DATA[bian_shang], "bian_xia": GUA_DATA[bian_xia],
+        "ti_gua": GUA_DATA[ti], "yong_gua": GUA_DATA[yong], "bian_res_gua": GUA_DATA[bian_res],
+        "ti_id": ti, "yong_id": yong, "bian_res_id": bian_res,
+    }
+
+
+def cast_numbers(num1, num2):
+    return cast(*number_to_trigrams(num1, num2))
+
+
+def cast_time(year_num, month_num, day_num, hour_num):
+    return cast(*time_to_trigrams(year_num, month_num, day_num, hour_num))
+
+
+# ================= 批量起卦 =================
+def batch_cast(shang, xia, dong_yao):
+    """
+    向量化批量排盘。参数为等长的数组（上卦 1~8、下卦 1~8、动爻 1~6）。
+    返回字典，各字段为与输入等长的 uint8 数组：
+    ben / hu / bian 为重卦编号，ti / yong / bian_res 为经卦编号。
+    """
+    shang = np.asarray(shang, dtype=np.int64)
+    xia = np.asarray(xia, dtype=np.int64)
+    dong = np.asarray(dong_yao, dtype=np.int64)
+    if shang.shape != xia.shape or shang.shape != dong.shape:
+        raise ValueError("shang / xia / dong_yao 长度必须一致")
+    if shang.size and (shang.min() < 1 or shang.max() > 8 or xia.min() < 1 or xia.max() > 8):
+        raise ValueError("经卦编号必须在 1~8 之间")
+    if dong.size and (dong.min() < 1 or dong.max() > 6):
+        raise ValueError("动爻必须在 1~6 之间")
+
+    ben = (shang - 1) * 8 + (xia - 1)
+    bian = BIAN_ARRAY[ben, dong - 1].astype(np.int64)
+    upper = dong > 3
+    return {
+        "ben": ben.astype(np.uint8),
+        "hu": HU_ARRAY[ben],
+        "bian": bian.astype(np.uint8),
+        "ti": np.where(upper, xia, shang).astype(np.uint8),
+        "yong": np.where(upper, shang, xia).astype(np.uint8),
+        "bian_res": np.where(upper, bian // 8 + 1, bian % 8 + 1).astype(np.uint8),
+    }
+
+
+def batch_cast_numbers(num1, num2):
+    """数字起卦的批量版本：num1 / num2 为等长的正整数数组"""
+    num1 = np.asarray(num1, dtype=np.int64)
+    num2 = np.asarray(num2, dtype=np.int64)
+    return batch_cast((num1 - 1) % 8 + 1, (num2 - 1) % 8 + 1, (num1 + num2 - 1) % 6 + 1)
+
+
+def batch_cast_time(year_num, month_num, day_num, hour_num):
+    """时间起卦的批量版本：参数为等长的整数数组"""
+    sum_shang = np.asarray(year_num, dtype=np.int64) + np.asarray(month_num, dtype=np.int64) \
+        + np.asarray(day_num, dtype=np.int64)
+    sum_xia = sum_shang + np.asarray(hour_num, dtype=np.int64)
+    return batch_cast((sum_shang - 1) % 8 + 1, (sum_xia - 1) % 8 + 1, (sum_xia - 1) % 6 + 1)
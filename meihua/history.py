@@ -0,0 +1,234 @@
+"""
+起卦历史（SQLite，WAL 模式，只追加）。
+
+每次解读保存问题、本/互/变卦与动爻、体用、八字、模型、解读模式与思考预算、完整解读与各阶段耗时，
+按用户 + 时间、卦象、模型建索引。列表查询只取摘要字段，全文在查看单条时再读取。
+
+用户 id 分两个命名空间：登录用户为 auth:<邮箱>，匿名用户为 anon:<随机令牌>（new_anon_token() 生成），
+地址栏里的令牌须符合生成格式，不能冒用他人邮箱读取其历史。
+
+    python -m meihua.history export --user auth:someone@example.com -o history.jsonl
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from . import settings
+
+SUMMARY_COLUMNS = ("id", "user", "created_at", "question", "method", "ben_id", "hu_id", "bian_id", "dong_yao",
+                   "ti_id", "yong_id", "ben_name", "bian_name", "model", "cached", "mode", "thinking_budget")
+DETAIL_COLUMNS = SUMMARY_COLUMNS + ("qigua_info", "bazi", "solar", "birth_place", "response", "timings", "usage")
+EXPORT_CSV_COLUMNS = DETAIL_COLUMNS
+
+AUTH_PREFIX = "auth:"
+ANON_PREFIX = "anon:"
+# 匿名令牌：32 位十六进制（new_anon_token() 的格式）
+_ANON_TOKEN = re.compile(r"[0-9a-f]{32}")
+
+
+def auth_user(email):
+    return AUTH_PREFIX + email
+
+
+def new_anon_token():
+    return secrets.token_hex(16)
+
+
+def anon_user(token):
+    """匿名令牌 -> 用户 id；令牌不符合生成格式时返回 None，由调用方重新生成"""
+    if not token or not _ANON_TOKEN.fullmatch(token):
+        return None
+    return ANON_PREFIX + token
+
+
+class HistoryStore:
+    """单连接 + 进程内锁；多进程可共享同一文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user TEXT NOT NULL CHECK (user LIKE 'auth:%' OR user LIKE 'anon:%'), created_at REAL NOT NULL,"
+            " question TEXT NOT NULL, method TEXT, qigua_info TEXT,"
+            " ben_id INTEGER, hu_id INTEGER, bian_id INTEGER, dong_yao INTEGER, ti_id INTEGER, yong_id INTEGER,"
+            " ben_name TEXT, bian_name TEXT, bazi TEXT, solar TEXT, birth_place TEXT,"
+            " model TEXT, cached INTEGER NOT NULL DEFAULT 0, response TEXT, timings TEXT, usage TEXT,"
+            " mode TEXT, thinking_budget INTEGER)"
+        )
+        # 旧库补列：解读模式与思考预算
+        existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(readings)")}
+        for column, decl in (("mode", "TEXT"), ("thinking_budget", "INTEGER")):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE readings ADD COLUMN {column} {decl}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_user_time ON readings(user, created_at, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_time ON readings(created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_gua ON readings(ben_id, bian_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_model ON readings(model, created_at)")
+        self._conn.commit()
+
+    def add(self, user, question, res, qigua_info="", method="", model="", response="", bazi="", solar="",
+            birth_place="", timings=None, usage=None, cached=False, created_at=None, mode="standard",
+            thinking_budget=None):
+        """保存一次解读，res 为 gua.cast() 的返回值；返回记录 id"""
+        row = {
+            "user": user, "created_at": created_at or time.time(), "question": question, "method": method,
+            "qigua_info": qigua_info, "ben_id": res["ben_id"], "hu_id": res["hu_id"], "bian_id": res["bian_id"],
+            "dong_yao": res["dong_yao"], "ti_id": res["ti_id"], "yong_id": res["yong_id"],
+            "ben_name": f"{res['ben_shang']['name']}上{res['ben_xia']['name']}下",
+            "bian_name": f"{res['bian_shang']['name']}上{res['bian_xia']['name']}下",
+            "bazi": bazi, "solar": solar, "birth_place": birth_place, "model": model, "cached": int(bool(cached)),
+            "response": response, "mode": mode, "thinking_budget": thinking_budget,
+            "timings": json.dumps(timings or {}, ensure_ascii=False),
+            "usage": json.dumps(usage or {}, ensure_ascii=False),
+        }
+        columns = ", ".join(row)
+        marks = ", ".join("?" * len(row))
+        with self._lock:
+            cur = self._conn.execute(f"INSERT INTO readings ({columns}) VALUES ({marks})", tuple(row.values()))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def page(self, user, before=None, limit=10, ben_id=None, model=None):
+        """
+        按时间倒序的摘要列表（不含解读全文）。before 为上一页最后一条的 (created_at, id)，
+        沿 (user, created_at, id) 索引游标翻页，翻到多深都只扫描一页的行。
+        """
+        where, args = ["user = ?"], [user]
+        if before is not None:
+            where.append("(created_at, id) < (?, ?)")
+            args.extend(before)
+        if ben_id is not None:
+            where.append("ben_id = ?")
+            args.append(ben_id)
+        if model:
+            where.append("model = ?")
+            args.append(model)
+        sql = (f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM readings WHERE {' AND '.join(where)}"
+               " ORDER BY created_at DESC, id DESC LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, (*args, limit)).fetchall()
+        return [dict(r) for r in rows]
+
+    def get(self, reading_id, user=None):
+        """单条完整记录；指定 user 时只返回该用户的记录"""
+        sql = f"SELECT {', '.join(DETAIL_COLUMNS)} FROM readings WHERE id = ?"
+        args = [reading_id]
+        if user is not None:
+            sql += " AND user = ?"
+            args.append(user)
+        with self._lock:
+            row = self._conn.execute(sql, args).fetchone()
+        return _decode(row) if row else None
+
+    def count(self, user):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM readings WHERE user = ?", (user,)).fetchone()[0]
+
+    def iter_user(self, user, batch=500):
+        """按时间正序逐批读取该用户的全部记录（导出用，不一次性载入内存）"""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(DETAIL_COLUMNS)} FROM readings WHERE user = ? AND id > ?"
+                    " ORDER BY id LIMIT ?", (user, last, batch)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _decode(row)
+            last = rows[-1]["id"]
+
+    def export(self, user, out, fmt="jsonl"):
+        """按行写出 JSONL 或 CSV 到文本文件 out，全程只持有一批记录"""
+        if fmt == "csv":
+            writer = csv.DictWriter(out, fieldnames=EXPORT_CSV_COLUMNS)
+            writer.writeheader()
+            for record in self.iter_user(user):
+                record["timings"] = json.dumps(record["timings"], ensure_ascii=False)
+                record["usage"] = json.dumps(record["usage"], ensure_ascii=False)
+                writer.writerow(record)
+        else:
+            for record in self.iter_user(user):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def export_file(self, user, fmt="jsonl"):
+        """导出到临时文件，返回读位置在开头的二进制文件对象（供下载按钮使用）"""
+        f = tempfile.TemporaryFile()
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        self.export(user, text, fmt)
+        text.flush()
+        text.detach()
+        f.seek(0)
+        return f
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _decode(row):
+    record = dict(row)
+    for key in ("timings", "usage"):
+        try:
+            record[key] = json.loads(record[key] or "{}")
+        except ValueError:
+            record[key] = {}
+    return record
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    """进程级默认历史库；关闭历史或数据库不可用时返回 None"""
+    global _default_store
+    if not settings.HISTORY_ENABLED:
+        return None
+    if _default_store is None:
+        with _default_lock:
+            if _default_store is None:
+                try:
+                    _default_store = HistoryStore(settings.HISTORY_PATH)
+                except sqlite3.Error:
+                    return None
+    return _default_store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起卦历史导出")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="导出某用户的全部历史")
+    export.add_argument("--user", required=True, help="用户 id，如 auth:<邮箱> 或 anon:<令牌>")
+    export.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    export.add_argument("-o", "--output", help="输出文件，缺省写到标准输出")
+    export.add_argument("--db", default=settings.HISTORY_PATH)
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            store.export(args.user, f, args.format)
+    else:
+        store.export(args.user, sys.stdout, args.format)
+
+
+if __name__ == "__main__":
+    main()
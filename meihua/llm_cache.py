@@ -0,0 +1,147 @@
+"""
+解读结果持久化缓存（SQLite）。
+
+相同问题、相同本/互/变卦与动爻、相同八字信息、相同模型在 temperature=0.2 下的解读基本一致，
+按规范化后的输入做哈希，命中时直接复用，不再调用大模型。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from . import policy, settings
+
+# 提示词或调用参数变化时递增，使旧缓存自然失效
+PROMPT_VERSION = 4
+
+
+def normalize_text(text):
+    """全角转半角、去首尾空白、合并连续空白，避免无意义差异导致缓存未命中"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split())
+
+
+def make_key(question, ben_id, hu_id, bian_id, dong_yao, bazi_block, model_name, month_zhi=None, mode=None):
+    """
+    mode 传 policy.choose() 实际选定的模式。月令旺衰与应期随起卦月份变化，月支也计入键；
+    快速模式输出格式不同，单独成键，深度模式不写入 mode，与加入模式之前的缓存键保持一致。
+    """
+    mode = policy.normalize_mode(mode)
+    payload = {
+        "v": PROMPT_VERSION,
+        "q": normalize_text(question),
+        "gua": [int(ben_id), int(hu_id), int(bian_id), int(dong_yao)],
+        "month": month_zhi,
+        "bazi": normalize_text(bazi_block),
+        "model": model_name,
+    }
+    if mode != policy.MODE_STANDARD:
+        payload["mode"] = mode
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite 响应缓存，带 TTL 与条数上限（超出时按最近访问时间淘汰）。
+    单连接 + 进程内锁，WAL 模式下多进程可同时读写同一文件。
+    """
+
+    def __init__(self, path, ttl=0, max_entries=0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and self.ttl > 0 and row[1] + self.ttl < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, response, model=""):
+        if not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at, hits)"
+                " VALUES (?, ?, ?, ?, ?, 0)", (key, model, response, now, now))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl and self.ttl > 0:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+        if self.max_entries and self.max_entries > 0:
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,))
+
+    def stats(self):
+        with self._lock:
+            count, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM responses").fetchone()
+        return {"entries": count, "hits": hits, "max_entries": self.max_entries, "ttl": self.ttl}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def replay_stream(text, chunk_size=None, interval=None, sleep=time.sleep):
+    """把缓存的完整回答切片输出，模拟流式效果"""
+    chunk_size = chunk_size or settings.LLM_CACHE_REPLAY_CHUNK
+    interval = settings.LLM_CACHE_REPLAY_INTERVAL if interval is None else interval
+    for i in range(0, len(text), chunk_size):
+        if i and interval > 0:
+            sleep(interval)
+        yield text[i:i + chunk_size]
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """进程级默认缓存；关闭缓存或数据库不可用时返回 None"""
+    global _default_cache
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                try:
+                    _default_cache = ResponseCache(
+                        settings.LLM_CACHE_PATH, settings.LLM_CACHE_TTL, settings.LLM_CACHE_MAX_ENTRIES)
+                except sqlite3.Error:
+                    return None
+    return _default_cache
@@ -0,0 +1,344 @@
+"""
+进程级共享的大模型客户端。
+
+同一 (api_key, base_url) 只创建一个 OpenAI 客户端，底层 HTTP 连接池保持长连接，
+避免每次起卦都重新建池、重新 TLS 握手；另按模型设全局信号量，限制同时进行中的流式请求数
+（统一经 scheduler.AdmissionScheduler 准入占用，open_stream 本身不占配额）。
+"""
+import copy
+import threading
+
+from . import prompt, settings
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+_model_limits = settings.parse_model_map(settings.LLM_MODEL_MAX_STREAMS)
+
+
+def _pool_options():
+    """连接池与超时配置；openai SDK 底层使用 httpx2，Limits / Timeout 须取自同一个库"""
+    from httpx2 import Limits, Timeout
+
+    return {
+        "limits": Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": Timeout(settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+    }
+
+
+def _build_client(api_key, base_url):
+    from openai import DefaultHttpxClient, OpenAI
+
+    http_client = DefaultHttpxClient(**_pool_options())
+    # 重试统一由 scheduler.stream_with_retry 负责（429 退避、Retry-After、瞬时故障），SDK 不再重试
+    return OpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                  max_retries=0)
+
+
+def _build_async_client(api_key, base_url):
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    http_client = DefaultAsyncHttpxClient(**_pool_options())
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                       max_retries=0)
+
+
+def get_client(api_key, base_url):
+    """获取共享客户端（线程安全，OpenAI 客户端本身可跨线程复用）"""
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build_client(api_key, base_url)
+    return client
+
+
+def get_async_client(api_key, base_url):
+    """异步共享客户端，供 API 服务使用（连接池绑定在创建它的事件循环上）"""
+    key = ("async", api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build_async_client(api_key, base_url)
+    return client
+
+
+def chat_options(thinking_budget=None, max_tokens=None):
+    """解卦请求的统一参数：低温度、流末尾附带用量、按预算开启思考；max_tokens 限制输出长度（快速模式）"""
+    thinking_budget = settings.LLM_THINKING_BUDGET if thinking_budget is None else thinking_budget
+    options = {
+        "temperature": 0.2,
+        "top_p": 0.8,
+        "stream_options": {"include_usage": True},
+        "extra_body": {
+            'enable_thinking': thinking_budget > 0,
+            'thinking_budget': thinking_budget
+        },
+    }
+    if max_tokens:
+        options["max_tokens"] = max_tokens
+    return options
+
+
+def model_stream_limit(model):
+    return _model_limits.get(model, settings.LLM_MAX_STREAMS)
+
+
+def set_model_stream_limit(model, limit):
+    """调整某模型的并发上限；已在等待 / 进行中的请求沿用旧信号量直至结束"""
+    with _semaphores_lock:
+        _model_limits[model] = limit
+        _semaphores.pop(model, None)
+
+
+def _semaphore(model):
+    sem = _semaphores.get(model)
+    if sem is None:
+        with _semaphores_lock:
+            sem = _semaphores.get(model)
+            if sem is None:
+                sem = _semaphores[model] = threading.BoundedSemaphore(model_stream_limit(model))
+    return sem
+
+
+def try_acquire_slot(model):
+    """非阻塞占用一个流配额，成功返回 True；需配对调用 release_slot"""
+    return _semaphore(model).acquire(blocking=False)
+
+
+def release_slot(model):
+    _semaphore(model).release()
+
+
+def open_stream(client, model, messages, **kwargs):
+    """发起流式对话并逐个产出 chunk，不占用并发配额（由调用方或调度器负责）"""
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+    try:
+        for chunk in stream:
+            yield chunk
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+
+async def open_stream_async(client, model, messages, **kwargs):
+    """open_stream 的异步版本，client 为 AsyncOpenAI"""
+    stream = await client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            await close()
+
+
+# ================= 断点续写 =================
+# 续写开头至少缓冲这么多字再与已有正文比对重叠
+RESUME_HEAD_CHARS = 32
+RESUME_MAX_OVERLAP = 200
+
+
+def is_interrupted(exc):
+    """流是否因连接问题中断（断线、读超时），而非请求本身被拒绝"""
+    from openai import APIConnectionError
+
+    if isinstance(exc, APIConnectionError):
+        return True
+    # SDK 未包装、直接从底层 HTTP 库冒出的传输错误
+    return type(exc).__module__.split(".")[0] in ("httpx2", "httpcore2", "httpx", "httpcore") and not hasattr(exc, "response")
+
+
+def continuation_options(options):
+    """续写请求关闭思考：推理已体现在半截正文里，不必重新付一遍思考的时间与 token"""
+    options = dict(options)
+    options["extra_body"] = {**options.get("extra_body", {}), "enable_thinking": False, "thinking_budget": 0}
+    return options
+
+
+def _content(chunk):
+    if getattr(chunk, "choices", None):
+        return getattr(chunk.choices[0].delta, "content", None) or ""
+    return ""
+
+
+def _has_extra(chunk):
+    """去掉正文后是否还带有别的内容（结束原因、思考内容、用量）"""
+    if getattr(chunk, "usage", None) is not None:
+        return True
+    if getattr(chunk, "choices", None):
+        choice = chunk.choices[0]
+        return choice.finish_reason is not None or bool(getattr(choice.delta, "reasoning_content", None))
+    return False
+
+
+def trim_overlap(partial, text):
+    """去掉续写开头与已有正文末尾重复的部分"""
+    for k in range(min(len(partial), len(text), RESUME_MAX_OVERLAP), 3, -1):
+        if partial.endswith(text[:k]):
+            return text[k:]
+    return text
+
+
+class _Resume:
+    """续写状态：已输出的正文与续写开头的缓冲"""
+
+    def __init__(self, messages, options, retries, on_resume):
+        self.messages, self.options = messages, options
+        self.retries = settings.LLM_RESUME_RETRIES if retries is None else retries
+        self.on_resume = on_resume
+        self.pieces = []
+        self.attempt = 0
+        self.head = None
+        self.received = False
+
+    def request(self):
+        """本次要发起的 (messages, options)；首次为原请求，之后为续写请求"""
+        self.received = False
+        self.head = [] if self.attempt and self.pieces else None
+        if self.head is None:
+            return self.messages, self.options
+        return prompt.build_continuation(self.messages, "".join(self.pieces)), continuation_options(self.options)
+
+    def feed(self, chunk):
+        """
+        返回可以产出的 chunk 列表。续写开头的所有 chunk（含无正文的结束、用量 chunk）先按序缓冲，
+        正文够长或流结束时剪掉重叠，见 flush()。
+        """
+        self.received = True
+        if self.head is not None:
+            self.head.append(chunk)
+            return self.flush() if sum(len(_content(c)) for c in self.head) >= RESUME_HEAD_CHARS else []
+        text = _content(chunk)
+        if text:
+            self.pieces.append(text)
+        return [chunk]
+
+    def flush(self):
+        """先产出合并后的续写正文，再按原顺序产出缓冲的 chunk（去掉正文，只剩正文的不再产出）"""
+        if self.head is None:
+            return []
+        held, self.head = self.head, None
+        texts = [c for c in held if _content(c)]
+        out = []
+        text = trim_overlap("".join(self.pieces), "".join(_content(c) for c in texts))
+        if text:
+            merged = copy.deepcopy(texts[0])
+            merged.choices[0].delta.content = text
+            merged.choices[0].finish_reason = None
+            out.append(merged)
+            self.pieces.append(text)
+        for c in held:
+            if _content(c):
+                c.choices[0].delta.content = None
+                if not _has_extra(c):
+                    continue
+            out.append(c)
+        return out
+
+    def failed(self, exc):
+        """
+        中途断开且未超过次数时记一次续写并返回 True，否则返回 False 由调用方抛出。
+        首个 chunk 之前的失败由 scheduler.stream_with_retry 负责重试，这里不再重复。
+        """
+        if not self.received or not is_interrupted(exc) or self.attempt >= self.retries:
+            return False
+        self.attempt += 1
+        if self.on_resume is not None:
+            self.on_resume(self.attempt, sum(len(p) for p in self.pieces))
+        return True
+
+
+def resumable_stream(open_stream, messages, options, retries=None, on_resume=None):
+    """
+    open_stream(messages, options) 返回 chunk 迭代器。流中途因连接问题断开时不丢弃已输出的正文：
+    以半截回答为前缀发起续写请求（关闭思考），续写内容接在原输出之后继续产出，
+    调用方看到的是一条连续的流。最多续写 retries 次（默认 LLM_RESUME_RETRIES），之后原样抛出。
+    on_resume(attempt, chars) 在每次续写前调用，chars 为已输出的字数。
+    """
+    state = _Resume(messages, options, retries, on_resume)
+    while True:
+        try:
+            for chunk in open_stream(*state.request()):
+                yield from state.feed(chunk)
+            yield from state.flush()
+            return
+        except Exception as e:
+            if not state.failed(e):
+                raise
+
+
+async def resumable_stream_async(open_stream, messages, options, retries=None, on_resume=None):
+    """resumable_stream 的异步版本，open_stream() 返回异步 chunk 迭代器"""
+    state = _Resume(messages, options, retries, on_resume)
+    while True:
+        try:
+            async for chunk in open_stream(*state.request()):
+                for item in state.feed(chunk):
+                    yield item
+            for item in state.flush():
+                yield item
+            return
+        except Exception as e:
+            if not state.failed(e):
+                raise
+
+
+# ================= 用量统计 =================
+_usage_totals = {}
+_usage_lock = threading.Lock()
+
+
+def _field(obj, name, default=0):
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        value = obj.get(name, default)
+    else:
+        value = getattr(obj, name, default)
+    return default if value is None else value
+
+
+def parse_usage(usage):
+    """流末尾 usage -> {"prompt_tokens", "cached_tokens", "completion_tokens"}，不计入统计"""
+    return {
+        "prompt_tokens": int(_field(usage, "prompt_tokens")),
+        "cached_tokens": int(_field(_field(usage, "prompt_tokens_details", None), "cached_tokens")),
+        "completion_tokens": int(_field(usage, "completion_tokens")),
+    }
+
+
+def record_usage(model, usage):
+    """
+    记录流末尾 usage 中的输入 / 缓存命中 / 输出 token 数，累加到按模型的进程级统计，
+    返回本次用量字典。
+    """
+    record = parse_usage(usage)
+    with _usage_lock:
+        totals = _usage_totals.setdefault(model, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+        totals["calls"] += 1
+        for key, value in record.items():
+            totals[key] += value
+    return record
+
+
+def usage_stats():
+    """按模型汇总的用量，含缓存命中比例"""
+    with _usage_lock:
+        result = {}
+        for model, totals in _usage_totals.items():
+            item = dict(totals)
+            item["cache_hit_ratio"] = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+            result[model] = item
+        return result
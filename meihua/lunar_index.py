@@ -0,0 +1,187 @@
+"""
+农历预计算索引：时间起卦的 O(1) 查表路径。
+
+索引按公历日期（北京时间）逐日存放农历年干支、农历月（闰月为负）、农历日、
+节气月干支与日干支，时辰干支由日干与时辰序号推出，查表时不创建任何 lunar_python 对象。
+
+索引文件为 numpy 结构化数组（meihua/data/lunar_index.npy），以内存映射方式加载，
+多进程共享同一份页缓存。重新生成：
+
+    python -m meihua.lunar_index build
+"""
+import datetime
+import os
+import sys
+import threading
+
+import numpy as np
+
+START_DATE = datetime.date(1900, 1, 1)
+END_DATE = datetime.date(2100, 12, 31)
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "lunar_index.npy")
+
+INDEX_DTYPE = np.dtype([
+    ("year_gz", "u1"),   # 农历年干支序号 0~59（以正月初一为界，同 Lunar.getYearInGanZhi）
+    ("month", "i1"),     # 农历月，闰月为负数
+    ("day", "u1"),       # 农历日 1~30
+    ("month_gz", "u1"),  # 节气月干支序号 0~59（以节交接日为界，同 Lunar.getMonthInGanZhi）
+    ("day_gz", "u1"),    # 日干支序号 0~59
+])
+
+GAN = ("甲", "乙", "丙", "丁", "戊", "己", "庚", "辛", "壬", "癸")
+ZHI = ("子", "丑", "寅", "卯", "辰", "巳", "午", "未", "申", "酉", "戌", "亥")
+GANZHI = tuple(GAN[i % 10] + ZHI[i % 12] for i in range(60))
+MONTH_CN = ("", "正", "二", "三", "四", "五", "六", "七", "八", "九", "十", "冬", "腊")
+DAY_CN = ("", "初一", "初二", "初三", "初四", "初五", "初六", "初七", "初八", "初九", "初十",
+          "十一", "十二", "十三", "十四", "十五", "十六", "十七", "十八", "十九", "二十",
+          "廿一", "廿二", "廿三", "廿四", "廿五", "廿六", "廿七", "廿八", "廿九", "三十")
+
+# 儒略日数与 date.toordinal() 的差值
+_JDN_OFFSET = 1721425
+
+
+def ganzhi_index(gan_index, zhi_index):
+    """天干序号 (0~9) + 地支序号 (0~11) -> 六十甲子序号 (0~59)"""
+    return (6 * gan_index - 5 * zhi_index) % 60
+
+
+def hour_slot(hour):
+    """
+    小时 -> 时辰槽位 0~12。
+    0 为早子时 (00:00-00:59)，1~11 为丑至亥，12 为晚子时 (23:00-23:59)。
+    晚子时地支仍为子，但时干按次日日干推算，与 lunar_python 一致。
+    """
+    return (hour + 1) // 2
+
+
+def slot_time_ganzhi(day_gz, slot):
+    """由日干支序号与时辰槽位得到时辰干支序号"""
+    day_gan = (day_gz + (1 if slot == 12 else 0)) % 10
+    zhi = slot % 12
+    return ganzhi_index((day_gan % 5 * 2 + zhi) % 10, zhi)
+
+
+# ================= 构建 =================
+def build_index(start=START_DATE, end=END_DATE):
+    """用 lunar_python 的农历年 / 节气数据逐月展开生成索引（耗时数秒，只在部署时运行）"""
+    from lunar_python import LunarYear, Solar
+
+    base = start.toordinal()
+    n = end.toordinal() - base + 1
+    arr = np.zeros(n, dtype=INDEX_DTYPE)
+
+    # 农历年月日：按每个农历月的首日儒略日整段填充
+    for y in range(start.year - 1, end.year + 2):
+        ly = LunarYear.fromYear(y)
+        year_gz = ganzhi_index(ly.getGanIndex(), ly.getZhiIndex())
+        for m in ly.getMonthsInYear():
+            first = int(m.getFirstJulianDay() + 0.5) - _JDN_OFFSET - base
+            for d in range(m.getDayCount()):
+                i = first + d
+                if 0 <= i < n:
+                    arr[i] = (year_gz, m.getMonth(), d + 1, 0, 0)
+
+    # 节气月：十二节（小寒、立春、惊蛰……大雪）交接日起换月，干支按六十甲子连续递增
+    jie_days = set()
+    for y in range(start.year - 1, end.year + 2):
+        jds = LunarYear.fromYear(y).getJieQiJulianDays()
+        for k in range(0, len(jds), 2):
+            s = Solar.fromJulianDay(jds[k])
+            jie_days.add(datetime.date(s.getYear(), s.getMonth(), s.getDay()).toordinal() - base)
+    lunar = Solar.fromYmd(start.year, start.month, start.day).getLunar()
+    gz = ganzhi_index(lunar.getMonthGanIndex(), lunar.getMonthZhiIndex())
+    bounds = [0] + sorted(i for i in jie_days if 0 < i < n) + [n]
+    for lo, hi in zip(bounds, bounds[1:]):
+        arr["month_gz"][lo:hi] = gz % 60
+        gz += 1
+
+    # 日干支：儒略日数减 11 即为六十甲子序号
+    jdn = np.arange(n, dtype=np.int64) + base + _JDN_OFFSET
+    arr["day_gz"] = (jdn - 11) % 60
+    return arr
+
+
+def save_index(path=INDEX_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, build_index())
+    return path
+
+
+# ================= 查询 =================
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def load_index():
+    """以只读内存映射加载索引；文件缺失时返回 None，由调用方回退到 lunar_python"""
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None and os.path.exists(INDEX_PATH):
+                _INDEX = np.load(INDEX_PATH, mmap_mode="r")
+    return _INDEX
+
+
+def day_offset(date_obj):
+    """公历日期 -> 索引下标；超出覆盖范围返回 -1"""
+    i = date_obj.toordinal() - START_DATE.toordinal()
+    idx = load_index()
+    if idx is None or not 0 <= i < len(idx):
+        return -1
+    return i
+
+
+def lookup(date_obj, hour):
+    """
+    查询某日某时辰的农历数据，超出范围或索引缺失时返回 None。
+    返回字典：year_gz / month / day / month_gz / day_gz / time_gz（干支均为序号）与时辰槽位 slot。
+    """
+    i = day_offset(date_obj)
+    if i < 0:
+        return None
+    rec = _INDEX[i]
+    slot = hour_slot(hour)
+    return {
+        "year_gz": int(rec["year_gz"]), "month": int(rec["month"]), "day": int(rec["day"]),
+        "month_gz": int(rec["month_gz"]), "day_gz": int(rec["day_gz"]),
+        "time_gz": slot_time_ganzhi(int(rec["day_gz"]), slot), "slot": slot,
+    }
+
+
+def time_gua_numbers(date_obj, hour):
+    """
+    时间起卦所需的四个数与 lunar_info 文案，与 app.get_time_gua_numbers 的返回一致。
+    索引不可用时返回 None。
+    """
+    rec = lookup(date_obj, hour)
+    if rec is None:
+        return None
+    month = rec["month"]
+    month_cn = ("闰" if month < 0 else "") + MONTH_CN[abs(month)]
+    lunar_info = f"农历：{GANZHI[rec['year_gz']]}年 {month_cn}月 {DAY_CN[rec['day']]} {GANZHI[rec['time_gz']]}时"
+    return rec["year_gz"] % 12 + 1, abs(month), rec["day"], rec["time_gz"] % 12 + 1, lunar_info
+
+
+def time_gua_number_arrays(offsets, slots):
+    """
+    向量化查询：offsets 为索引下标数组，slots 为时辰槽位数组 (0~12)。
+    返回 (年支数, 农历月数, 农历日数, 时支数) 四个 int64 数组，可直接送入 gua.batch_cast_time。
+    """
+    idx = load_index()
+    if idx is None:
+        raise RuntimeError("农历索引文件缺失，请先运行 python -m meihua.lunar_index build")
+    rec = idx[np.asarray(offsets, dtype=np.int64)]
+    slots = np.asarray(slots, dtype=np.int64)
+    year_num = rec["year_gz"].astype(np.int64) % 12 + 1
+    month_num = np.abs(rec["month"].astype(np.int64))
+    day_num = rec["day"].astype(np.int64)
+    hour_num = slots % 12 + 1
+    return year_num, month_num, day_num, hour_num
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["build"]:
+        print(f"索引已生成：{save_index()}")
+    else:
+        print("用法：python -m meihua.lunar_index build")
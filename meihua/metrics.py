@@ -0,0 +1,277 @@
+"""
+分阶段耗时指标：每次起卦一个 Reading，记录各阶段耗时与流式输出统计，按模型、起卦方式与解读模式（深度 / 快速）打标签。
+
+结束时写一行 JSON 到耗时日志，并累加到进程内的 Prometheus 直方图 / 计数器，
+可由 render_prometheus() 输出文本格式，或用 start_http_server() 单独监听 /metrics。
+MEIHUA_METRICS_ENABLED=0 时 start_reading() 返回空实现，各钩子不做任何事。
+
+阶段（秒）：calendar（时间起卦农历查表）、cast（数字起卦）、bazi（八字详情）、prompt（提示词拼装）、
+queue_wait（准入排队）、ttft（准入后到首个 token）、stream_total（准入后到流结束）。
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import settings
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TPS_BUCKETS = (5, 10, 20, 40, 80, 160, 320, 640)
+
+
+# ================= 进程内指标 =================
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}     # (stage, model, method, mode) -> Histogram
+        self.tps = {}        # (model, method, mode) -> Histogram
+        self.readings = {}   # (model, method, mode, outcome) -> int
+        self.chunks = {}     # (model, method, mode) -> int
+        self.tokens = {}     # (model, method, mode) -> int
+
+    def add(self, record):
+        # mode 为解读模式（深度 / 快速，见 policy），未记录时视为深度
+        model, method, mode = record["model"], record["method"], record.get("mode", "standard")
+        with self._lock:
+            for stage, seconds in record["stages"].items():
+                hist = self.stages.get((stage, model, method, mode))
+                if hist is None:
+                    hist = self.stages[(stage, model, method, mode)] = Histogram(STAGE_BUCKETS)
+                hist.observe(seconds)
+            key = (model, method, mode)
+            if record.get("tokens_per_sec"):
+                self.tps.setdefault(key, Histogram(TPS_BUCKETS)).observe(record["tokens_per_sec"])
+            self.chunks[key] = self.chunks.get(key, 0) + record.get("chunks", 0)
+            self.tokens[key] = self.tokens.get(key, 0) + record.get("output_tokens", 0)
+            okey = (model, method, mode, record["outcome"])
+            self.readings[okey] = self.readings.get(okey, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            for table in (self.stages, self.tps, self.readings, self.chunks, self.tokens):
+                table.clear()
+
+
+registry = Registry()
+
+
+def _labels(**labels):
+    def esc(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name, hist, labels):
+    lines = []
+    cumulative = 0
+    for bound, n in zip(hist.buckets, hist.counts):
+        cumulative += n
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+# 其他模块登记的附加指标（如 sessions 的会话内存），每个返回若干行 Prometheus 文本
+_collectors = []
+
+
+def add_collector(collect):
+    if collect not in _collectors:
+        _collectors.append(collect)
+
+
+def render_prometheus(reg=None):
+    """Prometheus 文本格式（0.0.4）"""
+    reg = reg or registry
+    with reg._lock:
+        lines = ["# HELP meihua_stage_seconds 起卦各阶段耗时", "# TYPE meihua_stage_seconds histogram"]
+        for (stage, model, method, mode), hist in sorted(reg.stages.items()):
+            lines += _histogram_lines("meihua_stage_seconds", hist,
+                                      {"stage": stage, "model": model, "method": method, "mode": mode})
+        lines += ["# HELP meihua_output_tokens_per_second 流式输出速度", "# TYPE meihua_output_tokens_per_second histogram"]
+        for (model, method, mode), hist in sorted(reg.tps.items()):
+            lines += _histogram_lines("meihua_output_tokens_per_second", hist,
+                                      {"model": model, "method": method, "mode": mode})
+        lines += ["# HELP meihua_readings_total 起卦次数（按结果）", "# TYPE meihua_readings_total counter"]
+        for (model, method, mode, outcome), n in sorted(reg.readings.items()):
+            lines.append(f"meihua_readings_total{_labels(model=model, method=method, mode=mode, outcome=outcome)} {n}")
+        lines += ["# HELP meihua_stream_chunks_total 流式 chunk 数", "# TYPE meihua_stream_chunks_total counter"]
+        for (model, method, mode), n in sorted(reg.chunks.items()):
+            lines.append(f"meihua_stream_chunks_total{_labels(model=model, method=method, mode=mode)} {n}")
+        lines += ["# HELP meihua_output_tokens_total 输出 token 数", "# TYPE meihua_output_tokens_total counter"]
+        for (model, method, mode), n in sorted(reg.tokens.items()):
+            lines.append(f"meihua_output_tokens_total{_labels(model=model, method=method, mode=mode)} {n}")
+    for collect in list(_collectors):
+        lines += collect()
+    return "\n".join(lines) + "\n"
+
+
+# ================= 耗时日志 =================
+class JsonlLog:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    """按 settings 创建的耗时日志；未配置路径时返回 None"""
+    global _log
+    if _log is None and settings.METRICS_LOG_PATH:
+        with _log_lock:
+            if _log is None:
+                _log = JsonlLog(settings.METRICS_LOG_PATH)
+    return _log
+
+
+# ================= 单次起卦 =================
+class Reading:
+    def __init__(self, method, model, clock=time.perf_counter):
+        self.tags = {"method": method, "model": model}
+        self.stages = {}
+        self.values = {}
+        self._clock = clock
+        self._finished = False
+
+    @contextmanager
+    def span(self, stage):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + self._clock() - start
+
+    def record(self, stage, seconds):
+        self.stages[stage] = seconds
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def set(self, **values):
+        self.values.update(values)
+
+    def to_record(self, outcome):
+        record = {"ts": round(time.time(), 3), **self.tags, "outcome": outcome,
+                  "stages": {k: round(v, 6) for k, v in self.stages.items()}, **self.values}
+        # 输出速度按首 token 之后的生成时间计算
+        gen_time = self.stages.get("stream_total", 0.0) - self.stages.get("ttft", 0.0)
+        if record.get("output_tokens") and gen_time > 0:
+            record["tokens_per_sec"] = round(record["output_tokens"] / gen_time, 2)
+        return record
+
+    def finish(self, outcome="ok"):
+        """只生效一次，返回写出的记录"""
+        if self._finished:
+            return None
+        self._finished = True
+        record = self.to_record(outcome)
+        registry.add(record)
+        log = get_log()
+        if log is not None:
+            try:
+                log.write(record)
+            except OSError:
+                pass
+        return record
+
+
+class _NullReading:
+    """关闭指标时的空实现"""
+    tags = {}
+    stages = {}
+    values = {}
+
+    def span(self, stage):
+        return nullcontext()
+
+    def record(self, stage, seconds):
+        pass
+
+    def tag(self, **tags):
+        pass
+
+    def set(self, **values):
+        pass
+
+    def finish(self, outcome="ok"):
+        return None
+
+
+NULL_READING = _NullReading()
+
+
+def start_reading(method, model):
+    return Reading(method, model) if settings.METRICS_ENABLED else NULL_READING
+
+
+# ================= /metrics 端点 =================
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port=None, host=None):
+    """在后台线程监听 /metrics，返回 server；端口为 0 或被占用时返回 None"""
+    port = settings.METRICS_PORT if port is None else port
+    host = settings.METRICS_HOST if host is None else host
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
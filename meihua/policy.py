@@ -0,0 +1,96 @@
+"""
+解读策略：按模型、是否附八字、问题长度与类别为每次解读选择思考预算，并提供"快速"模式。
+
+- 深度（standard）：开启思考，预算由模型档位定基数，八字命卦合参另加，琐事与短问题下调，
+  长问题上调，最后限制在 [THINKING_MIN, settings.LLM_THINKING_BUDGET] 内；
+- 快速（fast）：关闭思考，输出改用精简格式（见 prompt.FAST_FORMAT），并限制输出长度。
+
+choose() 的结果随解读写入指标与历史，用于对比两种模式的延迟与质量。
+"""
+from . import settings
+
+MODE_STANDARD = "standard"
+MODE_FAST = "fast"
+MODES = (MODE_STANDARD, MODE_FAST)
+MODE_LABELS = {MODE_STANDARD: "🧘 深度", MODE_FAST: "⚡ 快速"}
+
+# 模型档位：按模型名关键字归类，未命中的按标准档
+MODEL_TIERS = (("light", ("turbo", "flash", "lite", "mini")), ("heavy", ("max", "r1", "reasoner")))
+TIER_BUDGET = {"light": 1024, "standard": 4096, "heavy": 6144}
+TIER_LABELS = {"light": "轻量模型", "standard": "标准模型", "heavy": "旗舰模型"}
+# 附八字时需命卦合参，额外的思考预算
+BAZI_BONUS = 2048
+THINKING_MIN = 512
+BUDGET_STEP = 256
+
+# 问题类别：(类别, 关键字, 预算系数)，取命中关键字最多的，同数取靠前的
+CATEGORIES = (
+    ("健康", ("病", "健康", "身体", "手术", "医", "孕"), 1.25),
+    ("事业", ("工作", "事业", "求职", "面试", "升职", "跳槽", "考试", "考研", "录取", "项目", "官"), 1.0),
+    ("财运", ("财", "钱", "投资", "股", "基金", "生意", "合伙", "借", "买房", "房子"), 1.0),
+    ("感情", ("感情", "姻缘", "婚", "恋", "对象", "复合", "喜欢", "桃花", "分手"), 1.0),
+    ("琐事", ("丢", "找", "失物", "天气", "出门", "快递", "吃", "今天", "明天"), 0.5),
+)
+DEFAULT_CATEGORY = "其他"
+
+# 问题长度（字数）系数
+SHORT_QUESTION = 10
+LONG_QUESTION = 60
+
+
+def model_tier(model):
+    name = (model or "").lower()
+    for tier, keywords in MODEL_TIERS:
+        if any(k in name for k in keywords):
+            return tier
+    return "standard"
+
+
+def categorize(question):
+    """问题类别与预算系数"""
+    best, hits = (DEFAULT_CATEGORY, 1.0), 0
+    for name, keywords, factor in CATEGORIES:
+        n = sum(k in question for k in keywords)
+        if n > hits:
+            best, hits = (name, factor), n
+    return best
+
+
+def normalize_mode(mode):
+    return mode if mode in MODES else MODE_STANDARD
+
+
+def choose(model, question, has_bazi=False, mode=MODE_STANDARD):
+    """
+    返回 {"mode", "thinking_budget", "max_tokens", "category", "reason"}；
+    max_tokens 为 None 时不限制输出长度。MEIHUA_THINKING_POLICY 关闭时深度模式沿用固定预算。
+    """
+    mode = normalize_mode(mode)
+    question = (question or "").strip()
+    category, factor = categorize(question)
+    if mode == MODE_FAST:
+        return {"mode": mode, "thinking_budget": 0, "max_tokens": settings.FAST_MAX_TOKENS,
+                "category": category, "reason": "快速模式：不思考，精简输出"}
+    if not settings.THINKING_POLICY:
+        return {"mode": mode, "thinking_budget": settings.LLM_THINKING_BUDGET, "max_tokens": None,
+                "category": category, "reason": "固定预算"}
+
+    tier = model_tier(model)
+    budget = TIER_BUDGET[tier]
+    reasons = [TIER_LABELS[tier]]
+    if has_bazi:
+        budget += BAZI_BONUS
+        reasons.append("命卦合参")
+    if factor != 1.0:
+        reasons.append(f"问{category}")
+    if len(question) < SHORT_QUESTION:
+        factor *= 0.75
+        reasons.append("问题简短")
+    elif len(question) > LONG_QUESTION:
+        factor *= 1.25
+        reasons.append("问题详细")
+    budget = round(budget * factor / BUDGET_STEP) * BUDGET_STEP
+    # 全局预算为上限（设为 0 即全局关闭思考）
+    budget = min(settings.LLM_THINKING_BUDGET, max(THINKING_MIN, budget))
+    return {"mode": mode, "thinking_budget": budget, "max_tokens": None,
+            "category": category, "reason": "、".join(reasons)}
@@ -0,0 +1,62 @@
+"""
+流式回答的节流渲染。
+
+逐块把模型输出追加到列表缓冲，按时间间隔或积累字数批量刷新到界面，结束时只完整渲染一次，
+避免每个 chunk 都把整段 Markdown 重新推送到浏览器。
+"""
+import time
+
+from . import settings
+
+CURSOR = " ▌"
+
+
+class StreamRenderer:
+    """
+    box 为 st.empty() 返回的占位容器（只需要 info / warning 方法）。
+    interval 与 min_chars 为刷新阈值，默认取 settings。
+    """
+
+    def __init__(self, box, icon="✨", interval=None, min_chars=None, clock=time.monotonic):
+        self.box = box
+        self.icon = icon
+        self.interval = settings.RENDER_INTERVAL if interval is None else interval
+        self.min_chars = settings.RENDER_MIN_CHARS if min_chars is None else min_chars
+        self._clock = clock
+        self._parts = []
+        self._pending_chars = 0
+        self._last_flush = clock()
+        self.flushes = 0
+        self.chunks = 0
+
+    def write(self, text):
+        if not text:
+            return
+        self._parts.append(text)
+        self._pending_chars += len(text)
+        self.chunks += 1
+        now = self._clock()
+        if now - self._last_flush >= self.interval or self._pending_chars >= self.min_chars:
+            self._render(self.text + CURSOR)
+            self._pending_chars = 0
+            self._last_flush = now
+
+    @property
+    def text(self):
+        # 合并已有片段，后续 join 只需处理一个长串加少量新片段
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def finish(self, empty_message="未获取到有效回复，请检查输入或重试。"):
+        """渲染最终结果并返回完整文本"""
+        text = self.text
+        if text:
+            self._render(text)
+        elif empty_message:
+            self.box.warning(empty_message)
+        return text
+
+    def _render(self, text):
+        self.box.info(text, icon=self.icon)
+        self.flushes += 1
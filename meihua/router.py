@@ -0,0 +1,238 @@
+"""
+延迟感知的模型路由与对冲请求。
+
+- LatencyTracker：按模型滚动记录首 token 延迟 (TTFT) 与输出速度 (tokens/s)，给出 p50 / p95；
+- hedged_stream：主模型在截止时间内没有吐出首个 token 时，在更快的模型上并行发起同一请求，
+  谁先出 token 用谁，另一路随即取消。
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from . import settings
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class LatencyTracker:
+    def __init__(self, window=None, min_samples=None):
+        self.window = settings.ROUTER_WINDOW if window is None else window
+        self.min_samples = settings.ROUTER_MIN_SAMPLES if min_samples is None else min_samples
+        self._ttft = {}
+        self._tps = {}
+        self._lock = threading.Lock()
+
+    def observe_ttft(self, model, seconds):
+        with self._lock:
+            self._ttft.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def observe_throughput(self, model, tokens, seconds):
+        if tokens > 0 and seconds > 0:
+            with self._lock:
+                self._tps.setdefault(model, deque(maxlen=self.window)).append(tokens / seconds)
+
+    def stats(self, model):
+        with self._lock:
+            ttft = list(self._ttft.get(model, ()))
+            tps = list(self._tps.get(model, ()))
+        return {
+            "samples": len(ttft),
+            "ttft_p50": _percentile(ttft, 50), "ttft_p95": _percentile(ttft, 95),
+            "tps_p50": _percentile(tps, 50),
+        }
+
+    def ranked(self, models):
+        """按 TTFT p50 从快到慢排序；样本不足的模型排在有数据的模型之后，保持原顺序"""
+        def key(item):
+            index, model = item
+            st = self.stats(model)
+            if st["samples"] < self.min_samples:
+                return 1, 0.0, index
+            return 0, st["ttft_p50"], index
+        return [m for _, m in sorted(enumerate(models), key=key)]
+
+    def label(self, model):
+        """界面上附在模型名后的实时延迟说明"""
+        st = self.stats(model)
+        if st["samples"] == 0:
+            return "延迟 暂无数据"
+        return f"首字 p50 {st['ttft_p50']:.1f}s / p95 {st['ttft_p95']:.1f}s"
+
+
+tracker = LatencyTracker()
+
+
+def pick_model(models):
+    """自动路由：选择当前首 token 延迟最低的模型"""
+    return tracker.ranked(models)[0]
+
+
+def hedge_candidates(primary, models, latency=None, deadline=None):
+    """
+    对冲候选：只保留有足够样本、且 TTFT p50 低于主模型 p95 的模型，按 p50 从快到慢。
+    主模型样本不足时以对冲截止时间作比较（对冲发起时主模型至少已等了这么久）。
+    """
+    latency = latency or tracker
+    deadline = settings.ROUTER_HEDGE_DEADLINE if deadline is None else deadline
+    primary_stats = latency.stats(primary)
+    if primary_stats["samples"] >= latency.min_samples:
+        threshold = primary_stats["ttft_p95"]
+    else:
+        threshold = deadline
+    candidates = []
+    for model in latency.ranked(models):
+        if model == primary:
+            continue
+        st = latency.stats(model)
+        if st["samples"] >= latency.min_samples and st["ttft_p50"] < threshold:
+            candidates.append(model)
+    return candidates
+
+
+def _has_token(chunk):
+    """chunk 是否带有实际输出（正文或思考内容），用于判定首 token"""
+    if getattr(chunk, "choices", None):
+        delta = chunk.choices[0].delta
+        return bool(getattr(delta, "content", None) or getattr(delta, "reasoning_content", None))
+    return False
+
+
+def _usage_tokens(chunk):
+    usage = getattr(chunk, "usage", None)
+    return getattr(usage, "completion_tokens", None) if usage is not None else None
+
+
+def hedged_stream(open_stream, primary, hedge_models=(), deadline=None, acquire=None,
+                  latency=None, thread_hook=None, clock=time.monotonic, primary_release=None):
+    """
+    open_stream(model) 返回 chunk 迭代器；产出 (model, chunk)。
+    hedge_models 为空时只做延迟统计，不对冲。acquire(model) 为对冲请求申请配额，
+    返回释放函数或 None（无配额则跳过该模型）。primary_release 为主请求配额的释放函数，
+    与对冲请求一样由读取线程退出时调用：落败的一路在取消后可能仍阻塞在 HTTP 读取上，
+    直到读取返回前都应计入该模型的并发上限。
+    每路请求在独立线程中读取；thread_hook(thread) 在线程启动前调用，
+    供 Streamlit 挂载脚本上下文，使 open_stream 内的界面回调可用。
+    """
+    latency = latency or tracker
+    deadline = settings.ROUTER_HEDGE_DEADLINE if deadline is None else deadline
+    events = queue.Queue()
+    cancels, launched, pending = {}, {}, {}
+
+    def run(model, release):
+        stream = None
+        try:
+            stream = open_stream(model)
+            for chunk in stream:
+                if cancels[model].is_set():
+                    break
+                events.put(("chunk", model, chunk))
+            events.put(("done", model, None))
+        except Exception as e:
+            events.put(("error", model, e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+            if release is not None:
+                release()
+
+    def launch(model, release=None):
+        cancels[model] = threading.Event()
+        launched[model] = clock()
+        pending[model] = []
+        thread = threading.Thread(target=run, args=(model, release), daemon=True)
+        if thread_hook is not None:
+            thread_hook(thread)
+        thread.start()
+
+    def try_hedge():
+        """在第一个有配额的候选模型上发起对冲，返回该模型；都不可用时返回 None"""
+        for model in hedge_models:
+            if model in launched:
+                continue
+            release = acquire(model) if acquire is not None else None
+            if acquire is not None and release is None:
+                continue
+            launch(model, release)
+            active.add(model)
+            return model
+        return None
+
+    launch(primary, primary_release)
+    active = {primary}
+    hedged = not hedge_models
+    winner = None
+    first_token_at = None
+    tokens = 0
+    usage_tokens = None
+    try:
+        while True:
+            timeout = None
+            if winner is None and not hedged:
+                timeout = max(0.0, launched[primary] + deadline - clock())
+            try:
+                kind, model, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                hedged = True
+                try_hedge()
+                continue
+
+            if winner is not None and model != winner:
+                continue
+            if kind == "chunk":
+                if winner is None:
+                    pending[model].append(payload)
+                    if not _has_token(payload):
+                        continue
+                    winner = model
+                    first_token_at = clock()
+                    latency.observe_ttft(model, first_token_at - launched[model])
+                    for other in launched:
+                        if other != model:
+                            cancels[other].set()
+                            # 落败的一路至少慢了这么久，作为下界样本计入
+                            latency.observe_ttft(other, first_token_at - launched[other])
+                    for buffered in pending[model]:
+                        tokens += 1 if _has_token(buffered) else 0
+                        yield model, buffered
+                    continue
+                if _has_token(payload):
+                    tokens += 1
+                usage_tokens = _usage_tokens(payload) or usage_tokens
+                yield model, payload
+            elif kind == "done":
+                if winner == model:
+                    latency.observe_throughput(model, usage_tokens or tokens, clock() - first_token_at)
+                    return
+                active.discard(model)
+                if not active:
+                    # 未产出任何 token 就结束：尚未对冲则换模型重试，否则把空响应交给调用方
+                    if not hedged:
+                        hedged = True
+                        if try_hedge():
+                            continue
+                    for buffered in pending[model]:
+                        yield model, buffered
+                    return
+            elif kind == "error":
+                if winner == model:
+                    raise payload
+                active.discard(model)
+                if not active:
+                    if not hedged:
+                        hedged = True
+                        if try_hedge():
+                            continue
+                    raise payload
+    finally:
+        for ev in cancels.values():
+            ev.set()
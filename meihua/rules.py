@@ -0,0 +1,135 @@
+"""
+五行断语引擎：体用生克、本卦到变卦的走向、动爻修正、月令旺衰与应期分级。
+
+规则与 SYSTEM_PROMPT 中的推演步骤一一对应，全部由 gua.cast() 的结果与起卦当月的月支
+查表得出，结果作为定论写进提示词与排盘摘要，模型只负责结合所问之事展开叙述。
+"""
+from . import casting, lunar_index
+
+WUXING = ("木", "火", "土", "金", "水")
+SHENG = {"木": "火", "火": "土", "土": "金", "金": "水", "水": "木"}   # 我生
+KE = {"木": "土", "火": "金", "土": "水", "金": "木", "水": "火"}       # 我克
+
+# 吉凶等级自低到高，动爻修正按此升降一级
+GRADES = ("大凶", "中平偏凶", "小吉", "大吉")
+RELATION_GRADE = {"用生体": 3, "比和": 3, "体克用": 2, "体生用": 1, "用克体": 0}
+
+# 月支（子 0 ~ 亥 11）当令五行
+ZHI_WUXING = ("水", "土", "木", "木", "土", "火", "火", "土", "金", "金", "土", "水")
+WANGSHUAI_RANK = {"旺": 2, "相": 1, "休": 0, "囚": -1, "死": -2}
+
+# 应期基数单位：(名称, 单位, 折合天数)
+TIMING_TIERS = (("短期琐事", "日", 1), ("中期事项", "周", 7), ("长期规划", "月", 30))
+
+
+def relation(ti_wx, other_wx):
+    """体与另一卦的生克关系：比和 / 用生体 / 体克用 / 体生用 / 用克体"""
+    if ti_wx == other_wx:
+        return "比和"
+    if SHENG[other_wx] == ti_wx:
+        return "用生体"
+    if KE[ti_wx] == other_wx:
+        return "体克用"
+    if SHENG[ti_wx] == other_wx:
+        return "体生用"
+    return "用克体"
+
+
+def wangshuai(wx, season_wx):
+    """五行在当令五行下的旺相休囚死"""
+    if wx == season_wx:
+        return "旺"
+    if SHENG[season_wx] == wx:
+        return "相"
+    if SHENG[wx] == season_wx:
+        return "休"
+    if KE[wx] == season_wx:
+        return "囚"
+    return "死"
+
+
+def month_branch(date_obj):
+    """起卦日期所在节气月的月支序号（子 0 ~ 亥 11），优先查农历索引"""
+    rec = lunar_index.lookup(date_obj, 12)
+    if rec is not None:
+        return rec["month_gz"] % 12
+    from lunar_python import Solar
+    return Solar.fromYmd(date_obj.year, date_obj.month, date_obj.day).getLunar().getMonthZhiIndex()
+
+
+def _branches(wx_set):
+    return "".join(z for z, wx in zip(lunar_index.ZHI, ZHI_WUXING) if wx in wx_set)
+
+
+def _shift(grade, step):
+    return max(0, min(len(GRADES) - 1, grade + step))
+
+
+def _trend(start, end):
+    good_start, good_end = start >= 2, end >= 2
+    if good_start and good_end:
+        return "始终顺遂" if end >= start else "吉中有退"
+    if not good_start and not good_end:
+        return "始终受阻" if end <= start else "凶中渐缓"
+    return "先吉后凶" if good_start else "先凶后吉"
+
+
+def _fmt(value):
+    value = round(value, 1)
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def judge(res, month_zhi):
+    """
+    res 为 gua.cast() 的返回值，month_zhi 为月支序号（见 month_branch）。
+    返回断语字典，字段均为可直接展示的字符串或整数。
+    """
+    ti_wx, yong_wx, bian_wx = res["ti_gua"]["wx"], res["yong_gua"]["wx"], res["bian_res_gua"]["wx"]
+    dong_yao = res["dong_yao"]
+
+    # 第二步：本卦体用定初始吉凶，变卦体用定结局
+    rel = relation(ti_wx, yong_wx)
+    grade = RELATION_GRADE[rel]
+    bian_rel = relation(ti_wx, bian_wx)
+    bian_grade = RELATION_GRADE[bian_rel]
+
+    # 单爻独动：动爻变出之卦生体升一级，克体降一级
+    if bian_rel == "用生体":
+        dong_step, dong_note = 1, f"动爻化出{res['bian_res_gua']['name']}{bian_wx}生体，升一级"
+    elif bian_rel == "用克体":
+        dong_step, dong_note = -1, f"动爻化出{res['bian_res_gua']['name']}{bian_wx}克体，降一级"
+    else:
+        dong_step, dong_note = 0, f"动爻化出{res['bian_res_gua']['name']}{bian_wx}，不生不克体，不升降"
+    adjusted = _shift(grade, dong_step)
+
+    # 月令旺衰
+    season_wx = ZHI_WUXING[month_zhi]
+    ti_state = wangshuai(ti_wx, season_wx)
+
+    # 应期：动爻数为基数，体卦旺相提前三分之一，休囚死延后一倍
+    if WANGSHUAI_RANK[ti_state] > 0:
+        factor, factor_note = 2 / 3, "体卦旺相，应期提前三分之一"
+    else:
+        factor, factor_note = 2, "体卦休囚死，应期延后一倍"
+    timing = [{"tier": name, "base": f"{dong_yao}{unit}", "adjusted": f"{_fmt(dong_yao * factor)}{unit}",
+               "days": round(dong_yao * factor * days)}
+              for name, unit, days in TIMING_TIERS]
+
+    return {
+        "ti_wx": ti_wx, "yong_wx": yong_wx, "bian_wx": bian_wx,
+        "relation": rel, "grade": GRADES[grade],
+        "bian_relation": bian_rel.replace("用", "变"), "bian_grade": GRADES[bian_grade],
+        "dong_step": dong_step, "dong_note": dong_note, "adjusted_grade": GRADES[adjusted],
+        "trend": _trend(adjusted, bian_grade),
+        "month_zhi": lunar_index.ZHI[month_zhi], "season_wx": season_wx,
+        "ti_state": ti_state, "yong_state": wangshuai(yong_wx, season_wx),
+        "bian_state": wangshuai(bian_wx, season_wx),
+        "timing_note": factor_note, "timing": timing,
+        "lucky_days": _branches({ti_wx, next(wx for wx in WUXING if SHENG[wx] == ti_wx)}),
+        "unlucky_days": _branches({next(wx for wx in WUXING if KE[wx] == ti_wx)}),
+    }
+
+
+def judge_at(res, date_obj=None):
+    """按起卦日期（缺省为北京时间今天）取月令后断卦"""
+    return judge(res, month_branch(date_obj or casting.get_beijing_time().date()))
@@ -0,0 +1,119 @@
+"""
+择吉时：扫描未来若干天的每个时辰，按时间起卦公式排出本卦 / 变卦与体用，
+挑出用生体、比和的时辰并排序。
+
+整段日期一次性从农历索引取出年支、农历月日，与时辰数组一起送入 gua.batch_cast_time，
+全程 numpy 向量化，不创建任何 lunar_python 对象；扫描一年（4745 个时段）只需数毫秒。
+
+子时按 lunar_index 拆成两段：早子时（00:00-01:00）与晚子时（23:00-24:00）分属不同日期，
+起出的卦不同，各自作为一个时段扫描；其余时辰为两小时一段。
+
+    python -m meihua.scanner --days 30 --top 10
+"""
+import argparse
+import datetime
+
+import numpy as np
+
+from . import casting, gua, lunar_index, rules, zhouyi
+
+# 每天 13 个时段，沿用 lunar_index 的槽位编号：0 为早子时，1~11 为丑至亥，12 为晚子时
+SLOTS = np.arange(0, 13, dtype=np.int64)
+SHICHEN_NAMES = ("早子时",) + tuple(z + "时" for z in lunar_index.ZHI[1:]) + ("晚子时",)
+DEFAULT_INCLUDE = ("用生体", "比和")
+
+# 经卦编号 -> 五行序号；(体, 他) 五行序号 -> 生克关系序号
+_TRIGRAM_WX = np.array([0] + [rules.WUXING.index(gua.GUA_DATA[g]["wx"]) for g in range(1, 9)], dtype=np.int64)
+RELATIONS = tuple(rules.RELATION_GRADE)
+_RELATION = np.array([[RELATIONS.index(rules.relation(a, b)) for b in rules.WUXING] for a in rules.WUXING],
+                     dtype=np.int64)
+_RELATION_GRADE = np.array([rules.RELATION_GRADE[r] for r in RELATIONS], dtype=np.int64)
+# (体五行, 月支) -> 旺相休囚死
+WANGSHUAI = tuple(rules.WANGSHUAI_RANK)
+_WANGSHUAI = np.array([[WANGSHUAI.index(rules.wangshuai(wx, season)) for season in rules.ZHI_WUXING]
+                       for wx in rules.WUXING], dtype=np.int64)
+_WANGSHUAI_RANK = np.array([rules.WANGSHUAI_RANK[w] for w in WANGSHUAI], dtype=np.int64)
+
+
+def slot_start_hour(slot):
+    """时辰槽位 -> 起始小时（早子时 0 点，丑时 1 点……亥时 21 点，晚子时 23 点）"""
+    return np.maximum(2 * slot - 1, 0)
+
+
+def slot_end_hour(slot):
+    """时辰槽位 -> 结束小时（早子时 1 点……亥时 23 点，晚子时 24 点）"""
+    return np.minimum(2 * slot + 1, 24)
+
+
+def scan(start=None, days=30, top=20, include=DEFAULT_INCLUDE):
+    """
+    从 start（北京时间，缺省为当前）起扫描 days 天内尚未结束的时段。
+    返回 {"scanned", "matched", "windows"}；windows 按体用、变卦、体卦旺衰依次择优，同分取较早者，
+    每项含 start / end（datetime）、时辰、本卦 / 变卦、动爻、体用关系与体卦旺衰。
+    """
+    start = start or casting.get_beijing_time()
+    first = lunar_index.day_offset(start.date())
+    if first < 0:
+        raise ValueError("起始日期超出农历索引范围（1900-2100）")
+    days = max(0, min(days, len(lunar_index.load_index()) - first))
+
+    day_no = np.repeat(np.arange(days, dtype=np.int64), len(SLOTS))
+    slots = np.tile(SLOTS, days)
+    hours = day_no * 24 + slot_start_hour(slots)
+    end_hours = day_no * 24 + slot_end_hour(slots)
+    # 跳过已结束的时段
+    now_hours = start.hour + start.minute / 60
+    keep = end_hours > now_hours
+    day_no, slots, hours, end_hours = day_no[keep], slots[keep], hours[keep], end_hours[keep]
+    offsets = first + day_no
+
+    year_num, month_num, day_num, hour_num = lunar_index.time_gua_number_arrays(offsets, slots)
+    cast = gua.batch_cast_time(year_num, month_num, day_num, hour_num)
+    dong_yao = (year_num + month_num + day_num + hour_num - 1) % 6 + 1
+
+    ti_wx = _TRIGRAM_WX[cast["ti"]]
+    relation = _RELATION[ti_wx, _TRIGRAM_WX[cast["yong"]]]
+    bian_relation = _RELATION[ti_wx, _TRIGRAM_WX[cast["bian_res"]]]
+    month_zhi = lunar_index.load_index()["month_gz"][offsets].astype(np.int64) % 12
+    state = _WANGSHUAI[ti_wx, month_zhi]
+
+    wanted = np.isin(relation, [RELATIONS.index(r) for r in include])
+    score = _RELATION_GRADE[relation] * 100 + _RELATION_GRADE[bian_relation] * 10 + _WANGSHUAI_RANK[state]
+    matched = np.flatnonzero(wanted)
+    order = matched[np.lexsort((hours[matched], -score[matched]))][:top]
+
+    base = datetime.datetime.combine(start.date(), datetime.time())
+    windows = []
+    for i in order:
+        ben, bian = int(cast["ben"][i]), int(cast["bian"][i])
+        slot = int(slots[i])
+        windows.append({
+            "start": base + datetime.timedelta(hours=int(hours[i])),
+            "end": base + datetime.timedelta(hours=int(end_hours[i])),
+            "shichen": SHICHEN_NAMES[slot],
+            "ben_id": ben, "bian_id": bian, "dong_yao": int(dong_yao[i]),
+            "ben_name": zhouyi.hexagram(ben)["full_name"], "bian_name": zhouyi.hexagram(bian)["full_name"],
+            "ti": gua.GUA_DATA[int(cast["ti"][i])]["name"], "yong": gua.GUA_DATA[int(cast["yong"][i])]["name"],
+            "relation": RELATIONS[relation[i]], "bian_relation": RELATIONS[bian_relation[i]].replace("用", "变"),
+            "ti_state": WANGSHUAI[state[i]], "score": int(score[i]),
+        })
+    return {"scanned": int(len(hours)), "matched": int(len(matched)), "windows": windows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="择吉时：扫描未来时辰的时间起卦结果")
+    parser.add_argument("--days", type=int, default=30, help="扫描天数")
+    parser.add_argument("--top", type=int, default=20, help="输出条数")
+    parser.add_argument("--start", help="起始时间 YYYY-MM-DD HH:MM（北京时间），缺省为当前")
+    args = parser.parse_args(argv)
+
+    start = datetime.datetime.strptime(args.start, "%Y-%m-%d %H:%M") if args.start else None
+    result = scan(start, args.days, args.top)
+    print(f"扫描 {result['scanned']} 个时段，用生体 / 比和 {result['matched']} 个：")
+    for w in result["windows"]:
+        print(f"{w['start']:%Y-%m-%d %H:%M} {w['shichen']}  {w['ben_name']} → {w['bian_name']}  "
+              f"动爻{w['dong_yao']}  体{w['ti']}用{w['yong']} {w['relation']}，{w['bian_relation']}，体{w['ti_state']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+"""
+大模型调用的准入控制与公平排队。
+
+- 按模型的令牌桶：以 token 计费（提示词 + 思考预算 + 预估输出），与服务商 TPM 配额对齐；
+- 有界 FIFO 队列：先到先得，排队位置通过回调实时告知界面，队列满则直接拒绝（削峰）；
+- 429 限流：清空令牌桶让后续请求退避，并对当前请求做带全抖动的指数退避重试；
+- 重试只在本模块做一层（SDK 客户端 max_retries=0），首个 chunk 之前的 429 与瞬时故障在此退避重试。
+"""
+import asyncio
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+from . import llm_client, settings
+
+# 队首等待并发配额释放时的轮询间隔（秒）
+SLOT_POLL_INTERVAL = 0.2
+
+
+class AdmissionError(RuntimeError):
+    """请求未被准入（排队已满或等待超时）"""
+
+
+class QueueFullError(AdmissionError):
+    pass
+
+
+class QueueTimeoutError(AdmissionError):
+    pass
+
+
+class SlotHold:
+    """
+    admit 占用的流配额：默认随上下文退出释放；hand_off() 之后改由接手方调用返回的释放函数，
+    用于配额须随读取线程而非调用方一同结束的场合（如对冲请求中落败仍阻塞在读取上的主请求）。
+    """
+
+    def __init__(self, release):
+        self._release = release
+        self.handed_off = False
+
+    def hand_off(self):
+        self.handed_off = True
+        return self._release
+
+
+def _slot_release(state, model):
+    """只生效一次的释放函数：归还流配额并唤醒排队者"""
+    released = threading.Event()
+
+    def release():
+        if released.is_set():
+            return
+        released.set()
+        llm_client.release_slot(model)
+        with state.cond:
+            state.cond.notify_all()
+    return release
+
+
+def estimate_cost(prompt_chars, thinking_budget=0, output_tokens=None):
+    """按字符数粗估提示词 token（中文约 1 字 1 token），加上思考预算与预估输出"""
+    if output_tokens is None:
+        output_tokens = settings.LLM_EXPECTED_OUTPUT_TOKENS
+    return int(prompt_chars) + int(thinking_budget or 0) + int(output_tokens)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = float(rate)          # 每秒补充的 token
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost):
+        """距离可支付 cost 还需等待的秒数；超过容量的请求在桶满时放行"""
+        self._refill()
+        need = min(cost, self.capacity)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, cost):
+        self._refill()
+        self.tokens -= min(cost, self.capacity)
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _ModelState:
+    def __init__(self, tpm, clock):
+        rate = tpm / 60.0
+        self.bucket = TokenBucket(rate, max(rate * settings.LLM_BUCKET_BURST, 1.0), clock)
+        self.queue = deque()
+        self.cond = threading.Condition()
+        # 协程排队（API 服务）：等待数与保证先到先得的锁（asyncio.Lock 按等待顺序唤醒）
+        self.async_waiting = 0
+        self.async_lock = None
+        self.admitted = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.rate_limited = 0
+
+
+class AdmissionScheduler:
+    def __init__(self, queue_max=None, queue_timeout=None, clock=time.monotonic):
+        self.queue_max = settings.LLM_QUEUE_MAX if queue_max is None else queue_max
+        self.queue_timeout = settings.LLM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self._clock = clock
+        self._tpm = settings.parse_model_map(settings.LLM_MODEL_TPM)
+        self._states = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _state(self, model):
+        state = self._states.get(model)
+        if state is None:
+            with self._lock:
+                state = self._states.get(model)
+                if state is None:
+                    state = self._states[model] = _ModelState(self._tpm.get(model, settings.LLM_TPM), self._clock)
+        return state
+
+    @contextmanager
+    def admit(self, model, cost, on_position=None, timeout=None):
+        """
+        排队直至轮到本请求、令牌桶足额且有空闲并发配额，期间占用一个流配额。
+        on_position(n) 在排队位置变化时回调（n 为前方请求数，0 表示即将开始）。
+        上下文值为 SlotHold，可把配额交给读取线程在其退出时释放。
+        """
+        state = self._state(model)
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = next(self._ids)
+        deadline = self._clock() + timeout
+        with state.cond:
+            if len(state.queue) >= self.queue_max:
+                state.shed += 1
+                raise QueueFullError(f"当前排队人数已满（{self.queue_max} 人），请稍后再试")
+            state.queue.append(ticket)
+            last_pos = None
+            try:
+                while True:
+                    pos = state.queue.index(ticket)
+                    if pos != last_pos and on_position is not None:
+                        last_pos = pos
+                        state.cond.release()
+                        try:
+                            on_position(pos)
+                        finally:
+                            state.cond.acquire()
+                        continue
+                    wait = None
+                    if pos == 0:
+                        wait = state.bucket.wait_time(cost)
+                        if wait == 0 and llm_client.try_acquire_slot(model):
+                            state.bucket.consume(cost)
+                            state.queue.popleft()
+                            state.admitted += 1
+                            state.cond.notify_all()
+                            break
+                        wait = max(wait, SLOT_POLL_INTERVAL)
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        state.timeouts += 1
+                        raise QueueTimeoutError("排队等待超时，请稍后再试")
+                    state.cond.wait(remaining if wait is None else min(wait, remaining))
+            except BaseException:
+                if ticket in state.queue:
+                    state.queue.remove(ticket)
+                    state.cond.notify_all()
+                raise
+        hold = SlotHold(_slot_release(state, model))
+        try:
+            yield hold
+        finally:
+            if not hold.handed_off:
+                hold.hand_off()()
+
+    @asynccontextmanager
+    async def admit_async(self, model, cost, timeout=None):
+        """
+        admit 的协程版本：等待者挂在事件循环上而不占线程，适合大量并发连接。
+        线程排队的请求优先；协程之间按到达顺序轮流检查令牌桶与流配额。
+        """
+        state = self._state(model)
+        timeout = self.queue_timeout if timeout is None else timeout
+        with state.cond:
+            if len(state.queue) + state.async_waiting >= self.queue_max:
+                state.shed += 1
+                raise QueueFullError(f"当前排队人数已满（{self.queue_max} 人），请稍后再试")
+            state.async_waiting += 1
+        try:
+            await asyncio.wait_for(self._acquire_async(state, model, cost), timeout)
+        except asyncio.TimeoutError:
+            with state.cond:
+                state.timeouts += 1
+            raise QueueTimeoutError("排队等待超时，请稍后再试") from None
+        finally:
+            with state.cond:
+                state.async_waiting -= 1
+        hold = SlotHold(_slot_release(state, model))
+        try:
+            yield hold
+        finally:
+            if not hold.handed_off:
+                hold.hand_off()()
+
+    async def _acquire_async(self, state, model, cost):
+        if state.async_lock is None:
+            state.async_lock = asyncio.Lock()
+        async with state.async_lock:
+            while True:
+                with state.cond:
+                    wait = SLOT_POLL_INTERVAL
+                    if not state.queue:
+                        wait = state.bucket.wait_time(cost)
+                        if wait == 0 and llm_client.try_acquire_slot(model):
+                            state.bucket.consume(cost)
+                            state.admitted += 1
+                            return
+                # 没有线程通知可等，按令牌桶缺口轮询（至多 1 秒一查）
+                await asyncio.sleep(min(max(wait, SLOT_POLL_INTERVAL), 1.0))
+
+    def try_admit(self, model, cost):
+        """
+        非阻塞准入（用于对冲请求）：队列为空、令牌桶足额且有空闲流配额时立即放行，
+        返回释放函数；否则返回 None，不进入排队。
+        """
+        state = self._state(model)
+        with state.cond:
+            if state.queue or state.bucket.wait_time(cost) > 0 or not llm_client.try_acquire_slot(model):
+                return None
+            state.bucket.consume(cost)
+            state.admitted += 1
+        return _slot_release(state, model)
+
+    def penalize(self, model):
+        """服务商返回 429：清空令牌桶，使排队请求按补充速率退避"""
+        state = self._state(model)
+        with state.cond:
+            state.bucket.drain()
+            state.rate_limited += 1
+
+    def queue_length(self, model):
+        return len(self._state(model).queue)
+
+    def stats(self):
+        return {
+            model: {
+                "queued": len(s.queue) + s.async_waiting, "admitted": s.admitted, "shed": s.shed,
+                "timeouts": s.timeouts, "rate_limited": s.rate_limited, "tokens": s.bucket.tokens,
+            }
+            for model, s in list(self._states.items())
+        }
+
+
+def _status(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def is_rate_limited(exc):
+    return _status(exc) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def is_transient(exc):
+    """上游瞬时故障：408 / 409 / 5xx，或未拿到响应的连接错误"""
+    status = _status(exc)
+    if status is not None:
+        return status in (408, 409) or status >= 500
+    return llm_client.is_interrupted(exc)
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """全抖动指数退避：[0, min(cap, base * 2^attempt)] 内均匀随机"""
+    base = settings.LLM_RATE_LIMIT_BACKOFF if base is None else base
+    cap = settings.LLM_RATE_LIMIT_BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after(exc):
+    """响应头 Retry-After / retry-after-ms 给出的等待秒数，没有时返回 None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class _Retries:
+    """
+    首个 chunk 之前的重试计数。SDK 客户端以 max_retries=0 创建，重试只在这里做一层：
+    429 最多 retries 次（并清空该模型令牌桶），瞬时故障最多 transient_retries 次。
+    """
+
+    def __init__(self, model, scheduler, retries, transient_retries):
+        self.model = model
+        self.scheduler = scheduler
+        self.retries = settings.LLM_RATE_LIMIT_RETRIES if retries is None else retries
+        self.transient_retries = settings.LLM_MAX_RETRIES if transient_retries is None else transient_retries
+        self.limited = 0
+        self.transient = 0
+
+    def delay(self, exc):
+        """可重试时返回等待秒数，否则返回 None"""
+        if is_rate_limited(exc):
+            if self.limited >= self.retries:
+                return None
+            self.scheduler.penalize(self.model)
+            attempt, self.limited = self.limited, self.limited + 1
+        elif is_transient(exc):
+            if self.transient >= self.transient_retries:
+                return None
+            attempt, self.transient = self.transient, self.transient + 1
+        else:
+            return None
+        delay = backoff_delay(attempt)
+        hinted = retry_after(exc)
+        if hinted is not None:
+            delay = max(delay, min(hinted, settings.LLM_RATE_LIMIT_BACKOFF_MAX))
+        return delay
+
+    @property
+    def attempts(self):
+        return self.limited + self.transient
+
+
+def stream_with_retry(open_stream, model, retries=None, scheduler=None, sleep=time.sleep, on_retry=None,
+                      transient_retries=None):
+    """
+    open_stream() 返回 chunk 迭代器。在收到首个 chunk 之前遇到 429 或瞬时故障时退避重试
+    （参考 Retry-After），已开始输出后的错误原样抛出。
+    """
+    state = _Retries(model, scheduler or get_scheduler(), retries, transient_retries)
+    while True:
+        try:
+            stream = iter(open_stream())
+            first = next(stream)
+        except StopIteration:
+            return
+        except Exception as e:
+            delay = state.delay(e)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(state.attempts, delay)
+            sleep(delay)
+            continue
+        yield first
+        yield from stream
+        return
+
+
+async def stream_with_retry_async(open_stream, model, retries=None, scheduler=None, on_retry=None,
+                                  transient_retries=None):
+    """stream_with_retry 的异步版本，open_stream() 返回异步 chunk 迭代器"""
+    state = _Retries(model, scheduler or get_scheduler(), retries, transient_retries)
+    while True:
+        stream = None
+        try:
+            stream = open_stream().__aiter__()
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except Exception as e:
+            if stream is not None and hasattr(stream, "aclose"):
+                await stream.aclose()
+            delay = state.delay(e)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(state.attempts, delay)
+            await asyncio.sleep(delay)
+            continue
+        try:
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+        return
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = AdmissionScheduler()
+    return _scheduler
@@ -0,0 +1,238 @@
+"""
+无界面的起卦解读流程：参数校验 -> 起卦 -> 八字 -> 提示词 -> 缓存 -> 协程准入 -> 流式解读。
+
+供 HTTP API 与批处理共用，与 app.py 的界面流程走同一套 gua / casting / bazi / prompt 模块。
+参数为普通字典（JSON 请求体或批处理的一行），结果以 (事件名, 数据) 的形式逐个产出。
+"""
+import asyncio
+import datetime
+import time
+from contextlib import aclosing
+
+from . import casting, llm_cache, llm_client, metrics, policy, rules, scheduler, settings, singleflight
+from . import prompt as prompt_builder
+from .bazi import calculate_bazi, get_bazi_detail
+
+
+class RequestError(ValueError):
+    """请求参数不合法"""
+
+
+def _int_param(params, name, low=None, high=None):
+    value = params.get(name)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise RequestError(f"参数 {name} 必须是整数") from None
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise RequestError(f"参数 {name} 超出范围")
+    return value
+
+
+def _cast_datetime(params):
+    """起卦时刻：date（YYYY-MM-DD）与 time（HH:MM），缺省取当前北京时间"""
+    now = casting.get_beijing_time()
+    try:
+        date_obj = datetime.date.fromisoformat(params["date"]) if params.get("date") else now.date()
+        time_obj = datetime.time.fromisoformat(params["time"]) if params.get("time") else now.time()
+    except (TypeError, ValueError):
+        raise RequestError("date 须为 YYYY-MM-DD，time 须为 HH:MM") from None
+    return date_obj, time_obj
+
+
+def cast_from_params(params):
+    """
+    method=number：num1、num2 为正整数；
+    method=time：date（YYYY-MM-DD）与 time（HH:MM），缺省取当前北京时间。
+    两种方式的 date 都用于取月令（见 rules.month_branch）。
+    返回 (method, res, qigua_info, verdict)。
+    """
+    method = params.get("method") or casting.METHOD_NUMBER
+    date_obj, time_obj = _cast_datetime(params)
+    if method == casting.METHOD_NUMBER:
+        res, qigua_info = casting.cast_by_numbers(_int_param(params, "num1", 1), _int_param(params, "num2", 1))
+    elif method == casting.METHOD_TIME:
+        res, qigua_info = casting.cast_by_time(date_obj, time_obj)
+    else:
+        raise RequestError(f"未知的起卦方式：{method}")
+    return method, res, qigua_info, rules.judge_at(res, date_obj)
+
+
+def bazi_from_params(birth):
+    """
+    birth：{"year", "month", "day", "hour", "minute", "birth_place"}；为空时返回 None。
+    返回 {"bazi", "solar", "birth_place", "detail"}。
+    """
+    if not birth:
+        return None
+    year = _int_param(birth, "year", 1, 9999)
+    month = _int_param(birth, "month", 1, 12)
+    day = _int_param(birth, "day", 1, 31)
+    hour = _int_param(birth, "hour", 0, 23)
+    minute = _int_param(birth, "minute", 0, 59) if birth.get("minute") is not None else 0
+    try:
+        datetime.date(year, month, day)
+    except ValueError:
+        raise RequestError("日期错误：不存在该日期") from None
+    bazi_str, solar_str, solar = calculate_bazi(year, month, day, hour, minute)
+    if solar is None:
+        raise RequestError(bazi_str)
+    return {"bazi": bazi_str, "solar": solar_str, "birth_place": birth.get("birth_place") or "未提供",
+            "detail": get_bazi_detail(solar)}
+
+
+def prepare(params):
+    """
+    校验参数并完成所有本地计算，返回解读所需的上下文；参数错误抛出 RequestError。
+    params：question、model、起卦参数（见 cast_from_params）、可选 birth（见 bazi_from_params）、
+    可选 mode（standard 深度 / fast 快速，见 policy）。
+    """
+    question = (params.get("question") or "").strip()
+    if not question:
+        raise RequestError("请填写您要占卜的事项")
+    model = params.get("model") or settings.API_DEFAULT_MODEL
+    if model not in settings.API_MODELS:
+        raise RequestError(f"未知的模型：{model}，可选：{'、'.join(settings.API_MODELS)}")
+    method = params.get("method") or casting.METHOD_NUMBER
+    mode = params.get("mode") or policy.MODE_STANDARD
+    if mode not in policy.MODES:
+        raise RequestError(f"未知的解读模式：{mode}")
+    reading = metrics.start_reading(method, model)
+
+    with reading.span("calendar" if method == casting.METHOD_TIME else "cast"):
+        method, res, qigua_info, verdict = cast_from_params(params)
+    with reading.span("bazi"):
+        bazi = bazi_from_params(params.get("birth"))
+    if bazi is not None:
+        bazi_block = prompt_builder.build_bazi_block(bazi["detail"], bazi["solar"], bazi["bazi"], bazi["birth_place"])
+    else:
+        bazi_block = prompt_builder.NO_BAZI_BLOCK
+    plan = policy.choose(model, question, bazi is not None, mode)
+    reading.tag(mode=plan["mode"], category=plan["category"])
+    reading.set(thinking_budget=plan["thinking_budget"])
+    with reading.span("prompt"):
+        messages = prompt_builder.build_messages(question, res, bazi_block, verdict, plan["mode"] == policy.MODE_FAST)
+    return {
+        "question": question, "model": model, "method": method, "result": res, "qigua_info": qigua_info,
+        "verdict": verdict, "bazi": bazi, "messages": messages, "reading": reading, "policy": plan,
+        "cache_key": llm_cache.make_key(question, res["ben_id"], res["hu_id"], res["bian_id"], res["dong_yao"],
+                                        bazi_block, model, verdict["month_zhi"], plan["mode"]),
+    }
+
+
+def cast_payload(prepared):
+    return {"method": prepared["method"], "qigua_info": prepared["qigua_info"], "result": prepared["result"],
+            "verdict": prepared["verdict"], "bazi": prepared["bazi"], "policy": prepared["policy"]}
+
+
+async def interpret(prepared, api_key=None, base_url=None, sched=None, thinking_budget=None):
+    """
+    异步流式解读，产出 (event, data)：
+    cast（排盘结果）-> delta（{"text"}，多次）-> usage（可选）-> done（{"model", "cached", "coalesced", "resumes"}）。
+    思考预算与输出上限取 prepare() 选定的策略，thinking_budget 显式给出时覆盖。
+    完全相同的请求已在途时不再另开上游流，跟随那一路输出（见 singleflight）。
+    准入失败、限流与上游错误原样抛出，由调用方转换为响应。
+    """
+    reading = prepared["reading"]
+    model = prepared["model"]
+    yield "cast", cast_payload(prepared)
+
+    cache = llm_cache.get_cache()
+    cached = await asyncio.to_thread(cache.get, prepared["cache_key"]) if cache else None
+    if cached:
+        yield "delta", {"text": cached}
+        reading.finish("cache_hit")
+        yield "done", {"model": model, "cached": True, "coalesced": False}
+        return
+
+    client = llm_client.get_async_client(api_key or settings.LLM_API_KEY, base_url or settings.LLM_BASE_URL)
+    sched = sched or scheduler.get_scheduler()
+    plan = prepared["policy"]
+    if thinking_budget is not None:
+        reading.set(thinking_budget=thinking_budget)
+    options = llm_client.chat_options(plan["thinking_budget"] if thinking_budget is None else thinking_budget,
+                                      plan["max_tokens"])
+    messages = prepared["messages"]
+    cost = scheduler.estimate_cost(sum(len(m["content"]) for m in messages), options["extra_body"]["thinking_budget"],
+                                   plan["max_tokens"])
+    flights = singleflight.get_async_flights() if settings.LLM_COALESCE else None
+    flight_key = singleflight.make_key(model, messages, options)
+    pieces = []
+    usage = None
+    chunks = 0
+    resumes = []
+    outcome = "error"
+    started_at = time.perf_counter()
+
+    async def upstream():
+        """领跑：准入排队后打开上游流"""
+        nonlocal started_at
+        queued_at = time.perf_counter()
+        async with sched.admit_async(model, cost):
+            started_at = time.perf_counter()
+            reading.record("queue_wait", started_at - queued_at)
+            # 上游中途断开时从已输出的正文续写；客户端中途断开时确保上游连接随之关闭
+            async with aclosing(llm_client.resumable_stream_async(
+                    lambda msgs, opts: scheduler.stream_with_retry_async(
+                        lambda: llm_client.open_stream_async(client, model, msgs, **opts),
+                        model, scheduler=sched),
+                    messages, options, on_resume=lambda attempt, chars: resumes.append(chars))) as stream:
+                async for chunk in stream:
+                    yield chunk
+
+    try:
+        while True:
+            flight, leader = flights.join(flight_key) if flights else (None, True)
+            if leader:
+                source = upstream() if flight is None else flights.lead(flight, upstream())
+            else:
+                # 相同请求已在途：跟随其上游流，先回放已缓冲的前缀
+                started_at = time.perf_counter()
+                source = flight.follow()
+            try:
+                first_token_at = None
+                async with aclosing(source) as stream:
+                    async for chunk in stream:
+                        if getattr(chunk, "usage", None):
+                            usage = (llm_client.record_usage(model, chunk.usage) if leader
+                                     else llm_client.parse_usage(chunk.usage))
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        if first_token_at is None and (getattr(delta, "content", None)
+                                                       or getattr(delta, "reasoning_content", None)):
+                            first_token_at = time.perf_counter()
+                            reading.record("ttft", first_token_at - started_at)
+                        if getattr(delta, "content", None):
+                            chunks += 1
+                            pieces.append(delta.content)
+                            yield "delta", {"text": delta.content}
+                reading.record("stream_total", time.perf_counter() - started_at)
+                break
+            except singleflight.FlightAbandoned:
+                # 领跑方在输出正文前放弃，自己重新发起；已输出部分则无法无缝接续
+                if pieces:
+                    raise
+        outcome = "ok" if leader else "coalesced"
+    except scheduler.AdmissionError:
+        outcome = "rejected"
+        raise
+    except (asyncio.CancelledError, GeneratorExit):
+        # 客户端断开
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        outcome = "rate_limited" if scheduler.is_rate_limited(e) else "error"
+        raise
+    finally:
+        reading.set(chunks=chunks, resumes=len(resumes))
+        if usage:
+            reading.set(output_tokens=usage["completion_tokens"])
+        reading.finish(outcome)
+
+    text = "".join(pieces)
+    if usage:
+        yield "usage", usage
+    if text and cache and leader:
+        await asyncio.to_thread(cache.put, prepared["cache_key"], text, model)
+    yield "done", {"model": model, "cached": False, "coalesced": not leader, "resumes": len(resumes)}
@@ -0,0 +1,242 @@
+"""
+会话内存：按 Streamlit 会话记录最近活跃时间与状态占用，并回收长时间空闲会话的可重建数据。
+
+- st.session_state 只放控件值与紧凑记录（如 bazi.compact_birth()），由会话自己的脚本线程读写；
+- 可随时重建的大块数据（历史列表、正在查看的历史全文、择时结果）经 get() / put() 放在本模块的进程级登记表里，
+  空闲超过 MEIHUA_SESSION_IDLE_TTL 即被清空，会话回来时按需重新加载；
+- 空闲超过 MEIHUA_SESSION_FORGET_TTL（浏览器早已关闭）的登记直接移除。
+
+回收在任一会话 touch() 时顺带进行，间隔不短于 MEIHUA_SESSION_SWEEP_INTERVAL；
+session_state 的占用也按同一间隔逐键估算，不在每次重跑时复制整个状态。
+report() 汇总各会话占用，显示在侧边栏「会话内存」（MEIHUA_SESSION_REPORT），
+同时以 meihua_session_* 指标出现在 /metrics（MEIHUA_METRICS_PORT）。
+"""
+import sys
+import threading
+import time
+
+from . import metrics, settings
+
+# 估算占用时的递归深度上限，避免遍历过深的对象图
+SIZE_DEPTH = 6
+
+
+def deep_sizeof(obj, depth=SIZE_DEPTH, _seen=None):
+    """粗估对象及其容器内元素的字节数（同一对象只计一次）"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, depth - 1, seen) + deep_sizeof(v, depth - 1, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, depth - 1, seen) for item in obj)
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        # 普通对象（如 lunar_python 的 Solar）按实例属性计
+        size += deep_sizeof(vars(obj), depth - 1, seen)
+    return size
+
+
+def state_sizeof(state):
+    """逐键估算 session_state 一类映射的占用，不复制整个状态"""
+    seen = set()
+    size = 0
+    for key in list(state.keys()):
+        try:
+            value = state[key]
+        except KeyError:
+            # 控件已注销而键仍在列表中
+            continue
+        size += deep_sizeof(key, _seen=seen) + deep_sizeof(value, _seen=seen)
+    return size
+
+
+def current_session_id():
+    """当前脚本所属的会话 id；不在 Streamlit 脚本线程中时返回 None"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+class SessionRegistry:
+    """进程级会话登记表：{session_id: {"last_seen", "measured_at", "measured_keys", "state_bytes", "data", "data_bytes"}}"""
+
+    def __init__(self, idle_ttl=None, forget_ttl=None, sweep_interval=None, clock=time.monotonic):
+        self.idle_ttl = settings.SESSION_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.forget_ttl = settings.SESSION_FORGET_TTL if forget_ttl is None else forget_ttl
+        self.sweep_interval = settings.SESSION_SWEEP_INTERVAL if sweep_interval is None else sweep_interval
+        self._clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+        self.evicted = 0        # 被清空可重建数据的次数
+        self.reclaimed_bytes = 0
+        self.forgotten = 0
+
+    def _slot(self, session_id):
+        slot = self._sessions.get(session_id)
+        if slot is None:
+            slot = self._sessions[session_id] = {"last_seen": self._clock(), "measured_at": None,
+                                                 "measured_keys": 0, "state_bytes": 0, "data": {}, "data_bytes": {}}
+        return slot
+
+    def touch(self, session_id, state=None):
+        """
+        记录会话活跃；state 为该会话的 session_state（原对象，不必复制），
+        距上次估算不足 sweep_interval 且键数未变时跳过估算。
+        """
+        now = self._clock()
+        keys = len(state) if state is not None else 0
+        with self._lock:
+            slot = self._slot(session_id)
+            slot["last_seen"] = now
+            measured_at = slot["measured_at"]
+            due = state is not None and (measured_at is None or keys != slot["measured_keys"]
+                                         or now - measured_at >= self.sweep_interval)
+            if due:
+                slot["measured_at"], slot["measured_keys"] = now, keys
+        if due:
+            state_bytes = state_sizeof(state)
+            with self._lock:
+                slot = self._sessions.get(session_id)
+                if slot is not None:
+                    slot["state_bytes"] = state_bytes
+        self.maybe_sweep()
+
+    def get(self, session_id, name, default=None):
+        with self._lock:
+            slot = self._sessions.get(session_id)
+            return slot["data"].get(name, default) if slot else default
+
+    def put(self, session_id, name, value):
+        size = deep_sizeof(value)
+        with self._lock:
+            slot = self._slot(session_id)
+            slot["data"][name] = value
+            slot["data_bytes"][name] = size
+
+    def pop(self, session_id, name):
+        with self._lock:
+            slot = self._sessions.get(session_id)
+            if slot:
+                slot["data_bytes"].pop(name, None)
+                return slot["data"].pop(name, None)
+
+    def maybe_sweep(self):
+        if self._clock() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+
+    def sweep(self):
+        """清空空闲会话的可重建数据，移除早已离开的会话；返回本次回收的字节数"""
+        now = self._clock()
+        reclaimed = 0
+        with self._lock:
+            self._last_sweep = now
+            for session_id, slot in list(self._sessions.items()):
+                idle = now - slot["last_seen"]
+                if self.forget_ttl > 0 and idle >= self.forget_ttl:
+                    reclaimed += sum(slot["data_bytes"].values())
+                    del self._sessions[session_id]
+                    self.forgotten += 1
+                elif self.idle_ttl > 0 and idle >= self.idle_ttl and slot["data"]:
+                    reclaimed += sum(slot["data_bytes"].values())
+                    slot["data"].clear()
+                    slot["data_bytes"].clear()
+                    self.evicted += 1
+            self.reclaimed_bytes += reclaimed
+        return reclaimed
+
+    def session_report(self, session_id):
+        """单个会话的占用：{"state_bytes", "data_bytes", "data_keys"}，未登记时返回 None"""
+        with self._lock:
+            slot = self._sessions.get(session_id)
+            if slot is None:
+                return None
+            return {"state_bytes": slot["state_bytes"], "data_bytes": sum(slot["data_bytes"].values()),
+                    "data_keys": sorted(slot["data"])}
+
+    def report(self, top=10):
+        """会话数、空闲数、状态与可回收数据的估算字节数，以及占用最多的 top 个会话"""
+        now = self._clock()
+        with self._lock:
+            rows = [{"session": session_id, "idle_seconds": now - slot["last_seen"],
+                     "state_bytes": slot["state_bytes"], "data_bytes": sum(slot["data_bytes"].values()),
+                     "data_keys": sorted(slot["data"])}
+                    for session_id, slot in self._sessions.items()]
+            evicted, reclaimed, forgotten = self.evicted, self.reclaimed_bytes, self.forgotten
+        idle = sum(1 for r in rows if self.idle_ttl > 0 and r["idle_seconds"] >= self.idle_ttl)
+        for r in rows:
+            r["idle_seconds"] = round(r["idle_seconds"], 1)
+        rows.sort(key=lambda r: r["state_bytes"] + r["data_bytes"], reverse=True)
+        return {
+            "sessions": len(rows),
+            "idle": idle,
+            "state_bytes": sum(r["state_bytes"] for r in rows),
+            "data_bytes": sum(r["data_bytes"] for r in rows),
+            "evicted": evicted, "reclaimed_bytes": reclaimed, "forgotten": forgotten,
+            "top": rows[:top],
+        }
+
+    def prometheus_lines(self):
+        stats = self.report(top=0)
+        return [
+            "# HELP meihua_sessions 登记的会话数", "# TYPE meihua_sessions gauge",
+            f"meihua_sessions {stats['sessions']}",
+            "# HELP meihua_sessions_idle 空闲超过回收阈值的会话数", "# TYPE meihua_sessions_idle gauge",
+            f"meihua_sessions_idle {stats['idle']}",
+            "# HELP meihua_session_bytes 会话占用估算（字节）", "# TYPE meihua_session_bytes gauge",
+            f'meihua_session_bytes{{kind="state"}} {stats["state_bytes"]}',
+            f'meihua_session_bytes{{kind="data"}} {stats["data_bytes"]}',
+            "# HELP meihua_session_evictions_total 空闲会话数据被回收的次数",
+            "# TYPE meihua_session_evictions_total counter",
+            f"meihua_session_evictions_total {stats['evicted']}",
+            "# HELP meihua_session_reclaimed_bytes_total 累计回收的估算字节数",
+            "# TYPE meihua_session_reclaimed_bytes_total counter",
+            f"meihua_session_reclaimed_bytes_total {stats['reclaimed_bytes']}",
+        ]
+
+
+_default = SessionRegistry()
+metrics.add_collector(_default.prometheus_lines)
+
+
+def get_registry():
+    return _default
+
+
+# ================= 当前会话的便捷接口 =================
+def touch(state=None):
+    session_id = current_session_id()
+    if session_id is not None:
+        _default.touch(session_id, state)
+
+
+def get(name, default=None):
+    session_id = current_session_id()
+    return _default.get(session_id, name, default) if session_id is not None else default
+
+
+def put(name, value):
+    session_id = current_session_id()
+    if session_id is not None:
+        _default.put(session_id, name, value)
+
+
+def pop(name):
+    session_id = current_session_id()
+    return _default.pop(session_id, name) if session_id is not None else None
+
+
+def report(top=10):
+    return _default.report(top)
+
+
+def session_report():
+    session_id = current_session_id()
+    return _default.session_report(session_id) if session_id is not None else None
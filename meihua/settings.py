@@ -0,0 +1,159 @@
+"""
+运行参数：统一从环境变量读取（前缀 MEIHUA_），便于在 Streamlit、API 服务与批处理间共用。
+"""
+import os
+
+
+def env_str(name, default):
+    return os.environ.get(name, default)
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    try:
+        return int(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# ================= 八字缓存 =================
+BAZI_CACHE_SIZE = env_int("MEIHUA_BAZI_CACHE_SIZE", 4096)
+BAZI_CACHE_TTL = env_float("MEIHUA_BAZI_CACHE_TTL", 24 * 3600)
+
+# ================= 解读结果缓存 =================
+LLM_CACHE_ENABLED = env_bool("MEIHUA_LLM_CACHE_ENABLED", True)
+LLM_CACHE_PATH = env_str("MEIHUA_LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "meihua", "llm_cache.sqlite3"))
+LLM_CACHE_TTL = env_float("MEIHUA_LLM_CACHE_TTL", 7 * 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = env_int("MEIHUA_LLM_CACHE_MAX_ENTRIES", 20000)
+# 命中缓存时是否模拟流式输出，以及每次输出的字数与间隔（秒）
+LLM_CACHE_REPLAY = env_bool("MEIHUA_LLM_CACHE_REPLAY", True)
+LLM_CACHE_REPLAY_CHUNK = env_int("MEIHUA_LLM_CACHE_REPLAY_CHUNK", 40)
+LLM_CACHE_REPLAY_INTERVAL = env_float("MEIHUA_LLM_CACHE_REPLAY_INTERVAL", 0.02)
+
+# ================= 相同请求合并 =================
+# 完全相同的解读同时在途时只发起一路上游流，其余会话跟随并回放已输出的前缀
+LLM_COALESCE = env_bool("MEIHUA_LLM_COALESCE", True)
+# 跟随者等待领跑方新输出的最长时间（秒），超时即判定领跑卡死；应不短于排队超时加首包读超时
+LLM_COALESCE_TIMEOUT = env_float("MEIHUA_LLM_COALESCE_TIMEOUT", 300)
+
+# ================= 会话内存 =================
+# 会话空闲多久（秒）后清空其可重建数据（历史列表、历史全文、择时结果），以及多久后移除登记；0 表示不回收
+SESSION_IDLE_TTL = env_float("MEIHUA_SESSION_IDLE_TTL", 15 * 60)
+SESSION_FORGET_TTL = env_float("MEIHUA_SESSION_FORGET_TTL", 24 * 3600)
+# 两次回收扫描的最小间隔（秒）
+SESSION_SWEEP_INTERVAL = env_float("MEIHUA_SESSION_SWEEP_INTERVAL", 60)
+# 侧边栏是否显示「会话内存」视图（各会话占用与回收统计）
+SESSION_REPORT = env_bool("MEIHUA_SESSION_REPORT", True)
+
+# ================= 流式渲染节流 =================
+# 两次刷新界面的最小间隔（秒）与积累字数阈值，满足其一即刷新
+RENDER_INTERVAL = env_float("MEIHUA_RENDER_INTERVAL", 0.25)
+RENDER_MIN_CHARS = env_int("MEIHUA_RENDER_MIN_CHARS", 1500)
+
+# ================= 大模型服务地址 =================
+# 指向本地模拟服务（python -m tools.fake_llm serve）即可离线联调与压测
+LLM_BASE_URL = env_str("MEIHUA_LLM_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+# 未配置 st.secrets 时的备用密钥
+LLM_API_KEY = env_str("MEIHUA_LLM_API_KEY", "") or env_str("DASHSCOPE_API_KEY", "")
+
+# 思考模型的思考 token 预算（按请求自适应时为上限）
+LLM_THINKING_BUDGET = env_int("MEIHUA_LLM_THINKING_BUDGET", 8192)
+
+# ================= 解读策略 =================
+# 按模型、八字与问题自适应选择思考预算（见 policy），关闭则深度模式固定用 LLM_THINKING_BUDGET
+THINKING_POLICY = env_bool("MEIHUA_THINKING_POLICY", True)
+# 快速模式的输出 token 上限
+FAST_MAX_TOKENS = env_int("MEIHUA_FAST_MAX_TOKENS", 1200)
+
+# ================= 大模型客户端连接池 =================
+LLM_POOL_MAX_CONNECTIONS = env_int("MEIHUA_LLM_POOL_MAX_CONNECTIONS", 100)
+LLM_POOL_MAX_KEEPALIVE = env_int("MEIHUA_LLM_POOL_MAX_KEEPALIVE", 20)
+LLM_KEEPALIVE_EXPIRY = env_float("MEIHUA_LLM_KEEPALIVE_EXPIRY", 120)
+LLM_CONNECT_TIMEOUT = env_float("MEIHUA_LLM_CONNECT_TIMEOUT", 10)
+# 流式读取的单次读超时：思考模型首包可能较慢
+LLM_READ_TIMEOUT = env_float("MEIHUA_LLM_READ_TIMEOUT", 180)
+# 首个 chunk 之前遇到 5xx / 连接错误时的重试次数（由 scheduler 重试，SDK 自身不重试）
+LLM_MAX_RETRIES = env_int("MEIHUA_LLM_MAX_RETRIES", 2)
+# 每个模型同时进行中的流式请求上限，可按模型覆盖，如 "qwen-max=4,qwen-turbo=16"
+LLM_MAX_STREAMS = env_int("MEIHUA_LLM_MAX_STREAMS", 8)
+LLM_MODEL_MAX_STREAMS = env_str("MEIHUA_LLM_MODEL_MAX_STREAMS", "")
+
+
+def parse_model_map(text, cast=int):
+    """解析 "model=value,model=value" 形式的按模型配置"""
+    result = {}
+    for item in (text or "").split(","):
+        if "=" in item:
+            key, value = item.split("=", 1)
+            try:
+                result[key.strip()] = cast(value.strip())
+            except ValueError:
+                continue
+    return result
+
+# ================= 调用准入与排队 =================
+# 每个模型每分钟可消耗的 token 预算（含思考 token），可按模型覆盖，如 "qwen-max=200000"
+LLM_TPM = env_int("MEIHUA_LLM_TPM", 600000)
+LLM_MODEL_TPM = env_str("MEIHUA_LLM_MODEL_TPM", "")
+# 令牌桶容量折合多少秒的配额，决定可承受的瞬时突发
+LLM_BUCKET_BURST = env_float("MEIHUA_LLM_BUCKET_BURST", 10)
+# 单次调用预估输出 token 数（思考预算另计）
+LLM_EXPECTED_OUTPUT_TOKENS = env_int("MEIHUA_LLM_EXPECTED_OUTPUT_TOKENS", 3000)
+# 每个模型的排队上限与最长排队时间（秒），超出即拒绝
+LLM_QUEUE_MAX = env_int("MEIHUA_LLM_QUEUE_MAX", 50)
+LLM_QUEUE_TIMEOUT = env_float("MEIHUA_LLM_QUEUE_TIMEOUT", 120)
+# 429 限流的退避重试次数、基准间隔与上限（秒），实际间隔带全抖动
+LLM_RATE_LIMIT_RETRIES = env_int("MEIHUA_LLM_RATE_LIMIT_RETRIES", 3)
+LLM_RATE_LIMIT_BACKOFF = env_float("MEIHUA_LLM_RATE_LIMIT_BACKOFF", 1.0)
+LLM_RATE_LIMIT_BACKOFF_MAX = env_float("MEIHUA_LLM_RATE_LIMIT_BACKOFF_MAX", 20)
+# 流中途断开时以已输出的正文为前缀自动续写的最多次数（0 为不续写）
+LLM_RESUME_RETRIES = env_int("MEIHUA_LLM_RESUME_RETRIES", 2)
+
+# ================= 延迟感知路由 =================
+# 首 token 超过该秒数仍未到达时，在更快的模型上发起对冲请求
+ROUTER_HEDGE_DEADLINE = env_float("MEIHUA_ROUTER_HEDGE_DEADLINE", 8)
+# 每个模型保留的最近延迟样本数
+ROUTER_WINDOW = env_int("MEIHUA_ROUTER_WINDOW", 200)
+# 样本不足时视为未知，至少需要多少个样本才参与排序
+ROUTER_MIN_SAMPLES = env_int("MEIHUA_ROUTER_MIN_SAMPLES", 3)
+
+# ================= 分阶段耗时指标 =================
+METRICS_ENABLED = env_bool("MEIHUA_METRICS_ENABLED", True)
+# 每次起卦一行 JSON 的耗时日志，留空则不写文件
+METRICS_LOG_PATH = env_str("MEIHUA_METRICS_LOG_PATH", os.path.join(os.path.expanduser("~"), ".cache", "meihua", "metrics.jsonl"))
+# Prometheus 文本格式指标端口（/metrics），0 表示不单独监听
+METRICS_PORT = env_int("MEIHUA_METRICS_PORT", 0)
+METRICS_HOST = env_str("MEIHUA_METRICS_HOST", "127.0.0.1")
+
+# ================= HTTP API 服务 =================
+API_HOST = env_str("MEIHUA_API_HOST", "127.0.0.1")
+API_PORT = env_int("MEIHUA_API_PORT", 8000)
+# 设置后要求请求头 Authorization: Bearer <token>
+API_TOKEN = env_str("MEIHUA_API_TOKEN", "")
+API_DEFAULT_MODEL = env_str("MEIHUA_API_DEFAULT_MODEL", "deepseek-v4-pro")
+# 允许调用的模型（逗号分隔），请求中的其他模型名一律拒绝；缺省模型总在其中
+API_MODELS = tuple(dict.fromkeys(
+    [API_DEFAULT_MODEL] + [m.strip() for m in env_str("MEIHUA_API_MODELS", "deepseek-v4-pro,qwen-max,qwen-turbo").split(",") if m.strip()]))
+# 协程排队不占线程，队列上限可远大于界面
+API_QUEUE_MAX = env_int("MEIHUA_API_QUEUE_MAX", 5000)
+
+# ================= 起卦历史 =================
+HISTORY_ENABLED = env_bool("MEIHUA_HISTORY_ENABLED", True)
+HISTORY_PATH = env_str("MEIHUA_HISTORY_PATH", os.path.join(os.path.expanduser("~"), ".cache", "meihua", "history.sqlite3"))
+# 历史列表每次加载的条数
+HISTORY_PAGE_SIZE = env_int("MEIHUA_HISTORY_PAGE_SIZE", 10)
@@ -0,0 +1,199 @@
+"""
+相同请求合并（single-flight）：模型、消息与调用参数完全相同的解读同时在途时，只向上游发起一路流，
+其余请求跟随这一路——先回放已缓冲的前缀，再实时接收后续 chunk。
+
+- SingleFlight：线程版，供 Streamlit 会话（每个会话一个脚本线程）使用；
+- AsyncSingleFlight：协程版，供 HTTP API 与批处理使用。
+
+流结束（正常或出错）即从登记表移除，之后的相同请求交给响应缓存。领跑者中途放弃
+（会话重跑、客户端断开）时跟随者收到 FlightAbandoned，由调用方自行重新发起；
+领跑者超过 MEIHUA_LLM_COALESCE_TIMEOUT 秒没有新输出时视为卡死，跟随者收到 FlightStalled，
+这一路随即作废，之后的相同请求重新选出领跑者。
+"""
+import asyncio
+import hashlib
+import json
+import threading
+
+from . import settings
+
+
+class FlightAbandoned(Exception):
+    """领跑的请求在流结束前被放弃"""
+
+
+class FlightStalled(FlightAbandoned):
+    """领跑的请求长时间没有新输出"""
+
+
+def _stalled(timeout):
+    return FlightStalled(f"合并请求的领跑方 {timeout:g} 秒无输出")
+
+
+def make_key(model, messages, options):
+    """完整请求载荷的摘要"""
+    raw = json.dumps({"model": model, "messages": messages, "options": options},
+                     ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Flight:
+    """一路在途的上游流：按序缓冲全部 chunk，跟随者从头读取"""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        self._cond = threading.Condition()
+
+    def publish(self, item):
+        with self._cond:
+            self.items.append(item)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self, timeout=None):
+        """
+        先产出已缓冲的前缀，再阻塞等待后续 chunk；领跑出错时抛出同样的异常。
+        timeout 秒（缺省 MEIHUA_LLM_COALESCE_TIMEOUT）内没有新 chunk 时作废这一路并抛出 FlightStalled。
+        """
+        timeout = settings.LLM_COALESCE_TIMEOUT if timeout is None else timeout
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.items) and not self.done:
+                    if not self._cond.wait(timeout) and i >= len(self.items) and not self.done:
+                        self.done, self.error = True, _stalled(timeout)
+                        self._cond.notify_all()
+                batch, done, error = self.items[i:], self.done, self.error
+            # 在锁外产出，慢的跟随者不阻塞领跑者发布
+            yield from batch
+            i += len(batch)
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class AsyncFlight(Flight):
+    """协程版：等待新 chunk 时挂起协程而不是线程"""
+
+    def __init__(self, key):
+        super().__init__(key)
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, item):
+        self.items.append(item)
+        self._notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def follow(self, timeout=None):
+        timeout = settings.LLM_COALESCE_TIMEOUT if timeout is None else timeout
+        i = 0
+        while True:
+            if i < len(self.items):
+                i += 1
+                yield self.items[i - 1]
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.finish(_stalled(timeout))
+
+
+class SingleFlight:
+    """按请求摘要登记在途的流"""
+
+    flight_class = Flight
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key):
+        """返回 (flight, leader)：leader 为 True 时由调用方打开上游流并经 lead() 发布"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.done:
+                flight.followers += 1
+                self.coalesced += 1
+                return flight, False
+            flight = self.flight_class(key)
+            self._flights[key] = flight
+            return flight, True
+
+    def _forget(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def lead(self, flight, stream):
+        """包装领跑者的上游流：边产出边发布给跟随者"""
+        error = FlightAbandoned("合并请求的领跑方已中止")
+        try:
+            for item in stream:
+                flight.publish(item)
+                yield item
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._forget(flight)
+            flight.finish(error)
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights),
+                    "followers": sum(f.followers for f in self._flights.values()),
+                    "coalesced": self.coalesced}
+
+
+class AsyncSingleFlight(SingleFlight):
+    flight_class = AsyncFlight
+
+    async def lead(self, flight, stream):
+        error = FlightAbandoned("合并请求的领跑方已中止")
+        try:
+            async for item in stream:
+                flight.publish(item)
+                yield item
+            error = None
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._forget(flight)
+            flight.finish(error)
+
+
+_default = SingleFlight()
+_default_async = AsyncSingleFlight()
+
+
+def get_flights():
+    return _default
+
+
+def get_async_flights():
+    return _default_async
@@ -0,0 +1,69 @@
+"""
+通行本《周易》经文：64 卦卦辞与 384 爻辞，按重卦编号 hid 与爻位直接查表。
+
+原文存放在 meihua/data/zhouyi.json（通行本卦序，爻辞不含爻题），导入时一次性按
+hid = (上卦 - 1) * 8 + (下卦 - 1) 建索引；爻题（初九、六二……）与卦全名（水雷屯……）
+由卦画推出，不另存。
+"""
+import json
+import os
+
+from .gua import GUA_DATA, hexagram_bits, hexagram_id
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "zhouyi.json")
+
+# 八卦取象，用于拼卦全名
+TRIGRAM_IMAGE = {"乾": "天", "兑": "泽", "离": "火", "震": "雷", "巽": "风", "坎": "水", "艮": "山", "坤": "地"}
+POSITION = ("初", "二", "三", "四", "五", "上")
+
+
+def line_label(bit, yao):
+    """爻题：阳爻称九、阴爻称六，初、上二爻位名在前"""
+    num = "九" if bit else "六"
+    pos = POSITION[yao - 1]
+    return pos + num if yao in (1, 6) else num + pos
+
+
+def _load():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        entries = json.load(f)
+    name_to_id = {data["name"]: gid for gid, data in GUA_DATA.items()}
+    table = [None] * 64
+    for entry in entries:
+        upper, lower = entry["upper"], entry["lower"]
+        hid = hexagram_id(name_to_id[upper], name_to_id[lower])
+        bits = hexagram_bits(hid)
+        if upper == lower:
+            full_name = f"{upper}为{TRIGRAM_IMAGE[upper]}"
+        else:
+            full_name = TRIGRAM_IMAGE[upper] + TRIGRAM_IMAGE[lower] + entry["name"]
+        table[hid] = {
+            "hid": hid, "order": entry["n"], "name": entry["name"], "full_name": full_name,
+            "judgement": entry["judgement"],
+            "lines": [f"{line_label(bits[i], i + 1)}：{text}" for i, text in enumerate(entry["lines"])],
+            "extra": entry.get("extra", ""),
+        }
+    return table
+
+
+HEXAGRAMS = _load()
+
+
+def hexagram(hid):
+    """{"hid", "order"（通行本卦序）, "name", "full_name", "judgement", "lines", "extra"}"""
+    return HEXAGRAMS[hid]
+
+
+def line_text(hid, yao):
+    """带爻题的爻辞，yao 为 1~6，例如 "初九：潜龙勿用。" """
+    return HEXAGRAMS[hid]["lines"][yao - 1]
+
+
+def scripture(res):
+    """本次起卦相关的经文：本卦卦辞、本卦动爻爻辞、变卦卦辞；res 为 gua.cast() 的返回值"""
+    ben, bian = HEXAGRAMS[res["ben_id"]], HEXAGRAMS[res["bian_id"]]
+    return {
+        "ben_name": ben["full_name"], "ben_judgement": ben["judgement"],
+        "dong_line": line_text(res["ben_id"], res["dong_yao"]),
+        "bian_name": bian["full_name"], "bian_judgement": bian["judgement"],
+    }
@@ -0,0 +1 @@
+"""开发与运维工具：基准测试、本地模拟大模型服务等，不参与线上运行。"""
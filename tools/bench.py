@@ -0,0 +1,311 @@
+"""
+起卦全流程基准测试，结果输出为 JSON，便于在不同提交之间对比。
+
+阶段：
+- cast   数字 / 时间起卦与本互变推导（含批量接口、农历索引与 lunar_python 对照）
+- bazi   calculate_bazi / get_bazi_detail / get_birth_detail（冷缓存与热缓存）
+- prompt 提示词拼装
+- render 流式渲染循环（节流渲染与逐 chunk 全量刷新对照）
+- llm    经 llm_client 走本地模拟服务的完整流式调用（可配置首 token 延迟与输出速度）
+
+    python -m tools.bench --output bench.json
+    python -m tools.bench --stages cast,bazi --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from meihua import bazi, casting, gua, llm_client
+from meihua import prompt as prompt_builder
+from meihua.render import StreamRenderer
+
+ALL_STAGES = ("cast", "bazi", "prompt", "render", "llm")
+
+
+def measure(fn, number, repeat=5):
+    """重复 repeat 轮、每轮调用 number 次，返回单次耗时（微秒）的最小值与中位数"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    return {"us_per_op_min": min(samples), "us_per_op_median": statistics.median(samples),
+            "ops_per_sec": 1e6 / min(samples), "number": number, "repeat": repeat}
+
+
+def _cycle(items):
+    """返回依次取出 items 元素的无参函数，避免基准中混入随机数开销"""
+    it = iter(items)
+    state = {"it": it}
+
+    def nxt():
+        try:
+            return next(state["it"])
+        except StopIteration:
+            state["it"] = iter(items)
+            return next(state["it"])
+    return nxt
+
+
+def _random_datetimes(n, seed=7):
+    rng = random.Random(seed)
+    base = datetime.datetime(1950, 1, 1)
+    return [base + datetime.timedelta(minutes=rng.randrange(100 * 365 * 24 * 60)) for _ in range(n)]
+
+
+# ================= 各阶段 =================
+def bench_cast(scale):
+    rng = random.Random(1)
+    results = {}
+    nums = [(rng.randint(1, 999), rng.randint(1, 999)) for _ in range(1000)]
+    nxt = _cycle(nums)
+    results["cast.numbers"] = measure(lambda: gua.cast_numbers(*nxt()), 2000 * scale)
+
+    size = 100000 * scale
+    a = np.random.default_rng(1).integers(1, 1000, size)
+    b = np.random.default_rng(2).integers(1, 1000, size)
+    r = measure(lambda: gua.batch_cast_numbers(a, b), 1, repeat=5)
+    r["batch_size"] = size
+    r["ns_per_cast"] = r["us_per_op_min"] * 1000 / size
+    results["cast.numbers_batch"] = r
+
+    dts = _random_datetimes(1000)
+    nxt = _cycle(dts)
+    results["cast.time_numbers_index"] = measure(lambda: casting.get_time_gua_numbers(*_split(nxt())), 2000 * scale)
+    results["cast.time_numbers_lunar_python"] = measure(
+        lambda: casting.lunar_time_gua_numbers(*_split(nxt())), 20 * scale, repeat=3)
+    results["cast.by_time"] = measure(lambda: casting.cast_by_time(*_split(nxt())), 2000 * scale)
+    return results
+
+
+def _split(dt):
+    return dt.date(), dt.time()
+
+
+def bench_bazi(scale):
+    results = {}
+    births = _random_datetimes(200, seed=11)
+    nxt = _cycle(births)
+
+    def cold_chart():
+        bazi.clear_cache()
+        d = nxt()
+        bazi.calculate_bazi(d.year, d.month, d.day, d.hour, d.minute)
+
+    def cold_detail():
+        bazi.clear_cache()
+        d = nxt()
+        bazi.get_bazi_detail(bazi.calculate_bazi(d.year, d.month, d.day, d.hour, d.minute)[2])
+
+    results["bazi.calculate_cold"] = measure(cold_chart, 20 * scale, repeat=3)
+    results["bazi.detail_cold"] = measure(cold_detail, 20 * scale, repeat=3)
+
+    d = births[0]
+    solar = bazi.calculate_bazi(d.year, d.month, d.day, d.hour, d.minute)[2]
+    bazi.get_bazi_detail(solar)
+    results["bazi.calculate_warm"] = measure(lambda: bazi.calculate_bazi(d.year, d.month, d.day, d.hour, d.minute), 5000 * scale)
+    results["bazi.detail_warm"] = measure(lambda: bazi.get_bazi_detail(solar), 2000 * scale)
+    # 会话只存出生分钟时的取法
+    key = bazi.birth_key(solar)
+    results["bazi.birth_detail_warm"] = measure(lambda: bazi.get_birth_detail(key), 2000 * scale)
+    results["bazi.cache_stats"] = bazi.cache_stats()
+    return results
+
+
+def _sample_inputs():
+    res = gua.cast_numbers(3, 8)
+    d = datetime.datetime(1990, 5, 17, 8, 30)
+    bazi_str, solar_str, solar = bazi.calculate_bazi(d.year, d.month, d.day, d.hour, d.minute)
+    block = prompt_builder.build_bazi_block(bazi.get_bazi_detail(solar), solar_str, bazi_str, "北京")
+    return res, block
+
+
+def bench_prompt(scale):
+    res, block = _sample_inputs()
+    messages = prompt_builder.build_messages("近期换工作去北京发展是否顺利？", res, block)
+    r = measure(lambda: prompt_builder.build_messages("近期换工作去北京发展是否顺利？", res, block), 5000 * scale)
+    r["system_chars"] = len(messages[0]["content"])
+    r["user_chars"] = len(messages[1]["content"])
+    return {"prompt.build_messages": r}
+
+
+class _CountingBox:
+    """模拟 st.empty()：统计刷新次数与推送到前端的字节数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+
+    def info(self, text, icon=None):
+        self.calls += 1
+        self.bytes += len(text.encode("utf-8"))
+
+    def warning(self, text):
+        self.calls += 1
+
+
+def bench_render(scale, chunks=3000, chunk_text="吉凶"):
+    results = {}
+
+    def throttled():
+        box = _CountingBox()
+        renderer = StreamRenderer(box)
+        for _ in range(chunks):
+            renderer.write(chunk_text)
+        renderer.finish()
+        return box
+
+    def naive():
+        box = _CountingBox()
+        text = ""
+        for _ in range(chunks):
+            text += chunk_text
+            box.info(text + " ▌", icon="✨")
+        box.info(text, icon="✨")
+        return box
+
+    for name, fn in (("render.throttled", throttled), ("render.per_chunk", naive)):
+        r = measure(fn, 1, repeat=3 * scale)
+        box = fn()
+        r.update({"chunks": chunks, "ui_updates": box.calls, "bytes_pushed": box.bytes})
+        results[name] = r
+    return results
+
+
+def bench_llm(scale, ttft=0.2, tps=200.0, output_tokens=300, sessions=8, concurrency=4, reasoning_tokens=0):
+    from tools.fake_llm import FakeLLMConfig, start_server
+
+    server, base_url = start_server(FakeLLMConfig(ttft, tps, output_tokens, reasoning_tokens))
+    try:
+        client = llm_client.get_client("sk-fake", base_url)
+        res, block = _sample_inputs()
+        messages = prompt_builder.build_messages("近期换工作去北京发展是否顺利？", res, block)
+        ttfts, totals, chunk_counts = [], [], []
+        lock = threading.Lock()
+        sem = threading.Semaphore(concurrency)
+
+        def session():
+            with sem:
+                box = _CountingBox()
+                renderer = StreamRenderer(box)
+                start = time.perf_counter()
+                first = None
+                for chunk in llm_client.open_stream(client, "fake-model", messages,
+                                                    stream_options={"include_usage": True}):
+                    if chunk.choices and getattr(chunk.choices[0].delta, "content", None):
+                        if first is None:
+                            first = time.perf_counter() - start
+                        renderer.write(chunk.choices[0].delta.content)
+                renderer.finish()
+                total = time.perf_counter() - start
+                with lock:
+                    ttfts.append(first or total)
+                    totals.append(total)
+                    chunk_counts.append(renderer.chunks)
+
+        threads = [threading.Thread(target=session) for _ in range(sessions * scale)]
+        wall = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - wall
+    finally:
+        server.shutdown()
+
+    def pct(values, p):
+        return float(np.percentile(values, p)) if values else None
+
+    return {"llm.stream": {
+        "sessions": len(totals), "concurrency": concurrency,
+        "fake_ttft": ttft, "fake_tps": tps, "output_tokens": output_tokens,
+        "ttft_p50": pct(ttfts, 50), "ttft_p95": pct(ttfts, 95),
+        "total_p50": pct(totals, 50), "total_p95": pct(totals, 95),
+        "overhead_ttft_p50": (pct(ttfts, 50) or 0) - ttft,
+        "chunks_mean": statistics.mean(chunk_counts) if chunk_counts else 0,
+        "wall_seconds": wall,
+    }}
+
+
+# ================= 入口 =================
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__, "timestamp": datetime.datetime.now().isoformat(timespec="seconds")}
+
+
+def compare(current, baseline):
+    """打印与基线的耗时比值（>1 表示变慢）"""
+    lines = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric in ("us_per_op_min", "ttft_p50", "total_p50"):
+            if isinstance(cur.get(metric), (int, float)) and base.get(metric):
+                ratio = cur[metric] / base[metric]
+                flag = "  <-- 变慢" if ratio > 1.1 else ""
+                lines.append(f"{name:36s} {metric:16s} {base[metric]:12.3f} -> {cur[metric]:12.3f}  x{ratio:.2f}{flag}")
+    return "\n".join(lines)
+
+
+def run(stages, scale=1, llm_options=None):
+    runners = {
+        "cast": bench_cast, "bazi": bench_bazi, "prompt": bench_prompt, "render": bench_render,
+        "llm": lambda s: bench_llm(s, **(llm_options or {})),
+    }
+    results = {}
+    for stage in stages:
+        results.update(runners[stage](scale))
+    return {"meta": _meta(), "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="梅花易数起卦全流程基准测试")
+    parser.add_argument("--stages", default=",".join(ALL_STAGES), help=f"逗号分隔，可选 {','.join(ALL_STAGES)}")
+    parser.add_argument("--scale", type=int, default=1, help="迭代次数倍数")
+    parser.add_argument("--output", help="结果 JSON 写入路径（默认仅打印）")
+    parser.add_argument("--compare", help="与之对比的历史结果 JSON")
+    parser.add_argument("--ttft", type=float, default=0.2, help="模拟服务首 token 延迟（秒）")
+    parser.add_argument("--tps", type=float, default=200.0, help="模拟服务每秒输出 token 数")
+    parser.add_argument("--output-tokens", type=int, default=300)
+    parser.add_argument("--reasoning-tokens", type=int, default=0)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(ALL_STAGES)
+    if unknown:
+        parser.error(f"未知阶段：{','.join(sorted(unknown))}")
+    report = run(stages, args.scale, {
+        "ttft": args.ttft, "tps": args.tps, "output_tokens": args.output_tokens,
+        "reasoning_tokens": args.reasoning_tokens, "sessions": args.sessions, "concurrency": args.concurrency,
+    })
+    text = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
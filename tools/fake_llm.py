@@ -0,0 +1,381 @@
+"""
+本地 OpenAI 兼容的模拟 DashScope 服务（仅标准库），用于基准测试、压测与离线联调。
+
+三种用法：
+- 合成流：按配置的首 token 延迟、输出速度与长度生成回答，可带 reasoning_content 思考片段；
+- 回放：按录制文件中的真实 chunk 与时间间隔重放（含思考片段），可整体加速；
+- 录制：作为代理转发到真实服务，同时把流式响应连同时间间隔写入录制文件。
+
+两种模式均可注入 429 限流与流中途断开，用于验证重试、排队与续写逻辑。
+
+    python -m tools.fake_llm serve --port 8765 --ttft 1.5 --tps 60 --rate-limit 0.05
+    python -m tools.fake_llm record --upstream https://dashscope.aliyuncs.com/compatible-mode/v1 --out rec.jsonl
+    python -m tools.fake_llm serve --replay rec.jsonl --speed 2 --disconnect 0.02
+
+应用侧把 MEIHUA_LLM_BASE_URL 指向 http://127.0.0.1:8765/v1 即可。
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TEXT = (
+    "## 命卦总诀\n体用比和，内外同心，顺势而为必得其利。\n\n"
+    "## 当下卦象推演\n- **本卦（当下契机）**：上下同气，局面平稳。\n"
+    "- **互卦（过程隐情）**：暗中有贵人相助。\n- **变卦（最终结局）**：终得所愿。\n"
+)
+
+RATE_LIMIT_BODY = {"error": {"message": "Requests rate limit exceeded, please try again later.",
+                             "type": "limit_requests", "code": "limit_requests"}}
+
+
+class FakeLLMConfig:
+    def __init__(self, ttft=0.5, tps=50.0, output_tokens=400, reasoning_tokens=0, chars_per_token=2, text=None,
+                 rate_limit=0.0, disconnect=0.0, replay=None, speed=1.0, seed=None):
+        self.ttft = ttft                      # 首个 chunk 前的等待（秒）
+        self.tps = tps                        # 每秒输出 token 数，<=0 表示不限速
+        self.output_tokens = output_tokens    # 正文 token 数
+        self.reasoning_tokens = reasoning_tokens
+        self.chars_per_token = chars_per_token
+        self.text = text or DEFAULT_TEXT
+        self.rate_limit = rate_limit          # 以该概率直接返回 429
+        self.disconnect = disconnect          # 以该概率在流中途断开连接
+        self.replay = replay                  # ReplayStore，设置后忽略合成参数
+        self.speed = speed                    # 回放加速倍数
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def roll(self, probability):
+        with self._rng_lock:
+            return probability > 0 and self._rng.random() < probability
+
+    def randrange(self, start, stop):
+        with self._rng_lock:
+            return self._rng.randrange(start, stop)
+
+
+# ================= 录制文件 =================
+class ReplayStore:
+    """
+    录制文件为 JSONL，每行一次流式响应：
+    {"model": "...", "events": [[距上一事件的秒数, chunk 对象], ...]}
+    同一模型的多条录制轮流使用；找不到对应模型时使用任意一条。
+    """
+
+    def __init__(self, recordings):
+        if not recordings:
+            raise ValueError("录制文件为空")
+        self._by_model = {}
+        for rec in recordings:
+            self._by_model.setdefault(rec.get("model", ""), []).append(rec)
+        self._all = recordings
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def pick(self, model):
+        pool = self._by_model.get(model) or self._all
+        with self._lock:
+            rec = pool[self._counter % len(pool)]
+            self._counter += 1
+        return rec
+
+
+class Recorder:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def append(self, model, events):
+        line = json.dumps({"model": model, "recorded_at": time.time(), "events": events}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# ================= 合成响应 =================
+# 续写时重复已输出内容末尾的片段数
+CONTINUATION_OVERLAP = 3
+
+
+def _chunk(model, completion_id, delta=None, finish_reason=None, usage=None):
+    body = {
+        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        body["usage"] = usage
+    return body
+
+
+def _pieces(config):
+    """把模板文本循环切成 output_tokens 个片段"""
+    text, step = config.text, config.chars_per_token
+    pos = 0
+    for _ in range(config.output_tokens):
+        piece = text[pos:pos + step]
+        if len(piece) < step:
+            pos = 0
+            piece = text[:step]
+        pos += step
+        yield piece
+
+
+def _prompt_tokens(request):
+    return sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+
+
+def _usage(config, request):
+    prompt_tokens = _prompt_tokens(request)
+    completion_tokens = config.output_tokens + config.reasoning_tokens
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens, "prompt_tokens_details": {"cached_tokens": 0}}
+
+
+def _continuation_chars(request):
+    """续写请求（倒数第二条为半截 assistant 回答）返回已输出的字数，否则返回 None"""
+    messages = request.get("messages") or []
+    if len(messages) >= 2 and messages[-2].get("role") == "assistant":
+        return len(messages[-2].get("content") or "")
+    return None
+
+
+def synthetic_events(config, request):
+    """
+    返回 [(间隔秒数, chunk), ...]，首个间隔即首 token 延迟。
+    续写请求从已输出的位置接着生成，并故意重复末尾几个片段，模拟模型续写时的重叠。
+    """
+    model = request.get("model", "fake")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    gap = 1.0 / config.tps if config.tps > 0 else 0.0
+    pieces = list(_pieces(config))
+    reasoning_tokens = config.reasoning_tokens
+    done_chars = _continuation_chars(request)
+    if done_chars is not None:
+        skip, total = 0, 0
+        while skip < len(pieces) and total + len(pieces[skip]) <= done_chars:
+            total += len(pieces[skip])
+            skip += 1
+        pieces = pieces[max(0, skip - CONTINUATION_OVERLAP):]
+        reasoning_tokens = 0
+    events = [(config.ttft, _chunk(model, completion_id, {"role": "assistant", "content": ""}))]
+    events += [(gap, _chunk(model, completion_id, {"reasoning_content": "思"})) for _ in range(reasoning_tokens)]
+    events += [(gap, _chunk(model, completion_id, {"content": piece})) for piece in pieces]
+    events.append((0.0, _chunk(model, completion_id, {}, finish_reason="stop")))
+    if (request.get("stream_options") or {}).get("include_usage"):
+        events.append((0.0, _chunk(model, completion_id, None, usage=_usage(config, request))))
+    return events
+
+
+# ================= HTTP 处理 =================
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeLLMConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # 压测客户端放弃连接属于正常情况
+            pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = self._read_json()
+        if self.config.roll(self.config.rate_limit):
+            self._send_json(429, RATE_LIMIT_BODY, {"Retry-After": "1"})
+            return
+        self.handle_completion(request)
+
+    def handle_completion(self, request):
+        config = self.config
+        if not request.get("stream"):
+            time.sleep(config.ttft)
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(_pieces(config))},
+                             "finish_reason": "stop"}],
+                "usage": _usage(config, request),
+            })
+            return
+        if config.replay is not None:
+            rec = config.replay.pick(request.get("model", ""))
+            speed = config.speed if config.speed > 0 else 1.0
+            events = [(gap / speed, chunk) for gap, chunk in rec["events"]]
+        else:
+            events = synthetic_events(config, request)
+        cut = config.randrange(1, len(events)) if len(events) > 1 and config.roll(config.disconnect) else None
+        self.send_events(events, disconnect_after=cut)
+
+    # ---------- 分块传输的 SSE ----------
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def abort_stream(self):
+        """不发送结束块直接断开，客户端会得到不完整的分块响应"""
+        self.close_connection = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def send_events(self, events, disconnect_after=None):
+        try:
+            self.start_stream()
+            for i, (gap, chunk) in enumerate(events):
+                if disconnect_after is not None and i == disconnect_after:
+                    self.abort_stream()
+                    return
+                if gap > 0:
+                    time.sleep(gap)
+                self.write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class RecordingHandler(FakeLLMHandler):
+    """代理到真实服务并录制流式响应"""
+    upstream = ""
+    api_key = ""
+    recorder = None
+
+    def handle_completion(self, request):
+        if not request.get("stream"):
+            self._send_json(400, {"error": {"message": "录制模式只支持流式请求"}})
+            return
+        auth = self.headers.get("Authorization") or f"Bearer {self.api_key}"
+        req = urllib.request.Request(
+            self.upstream.rstrip("/") + "/chat/completions",
+            data=json.dumps(request, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": auth},
+            method="POST",
+        )
+        try:
+            upstream = urllib.request.urlopen(req, timeout=300)
+        except urllib.error.HTTPError as e:
+            self._send_json(e.code, json.loads(e.read() or b"{}"))
+            return
+        events = []
+        last = time.monotonic()
+        self.start_stream()
+        with upstream:
+            for raw in upstream:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                now = time.monotonic()
+                if payload != "[DONE]":
+                    events.append([round(now - last, 4), json.loads(payload)])
+                last = now
+                self.write_chunk(f"data: {payload}\n\n".encode("utf-8"))
+        self.end_stream()
+        self.recorder.append(request.get("model", ""), events)
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认监听队列只有 5，高并发压测时连接会排在 SYN 重传上，拉高首 token 延迟
+    request_queue_size = 1024
+
+
+def start_server(config=None, host="127.0.0.1", port=0, handler=FakeLLMHandler, **attrs):
+    """在后台线程启动模拟服务，返回 (server, base_url)；用 server.shutdown() 停止"""
+    attrs["config"] = config or FakeLLMConfig()
+    handler_cls = type("Configured" + handler.__name__, (handler,), attrs)
+    server = _Server((host, port), handler_cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟 DashScope 服务")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument("--host", default="127.0.0.1")
+        p.add_argument("--port", type=int, default=8765)
+        p.add_argument("--rate-limit", type=float, default=0.0, help="返回 429 的概率")
+        p.add_argument("--disconnect", type=float, default=0.0, help="流中途断开的概率")
+        p.add_argument("--seed", type=int)
+
+    serve = sub.add_parser("serve", help="合成或回放流式响应")
+    common(serve)
+    serve.add_argument("--ttft", type=float, default=0.5, help="首 token 延迟（秒）")
+    serve.add_argument("--tps", type=float, default=50.0, help="每秒输出 token 数")
+    serve.add_argument("--output-tokens", type=int, default=400)
+    serve.add_argument("--reasoning-tokens", type=int, default=0)
+    serve.add_argument("--replay", help="录制文件（JSONL），设置后按录制内容与节奏回放")
+    serve.add_argument("--speed", type=float, default=1.0, help="回放加速倍数")
+
+    record = sub.add_parser("record", help="代理真实服务并录制")
+    common(record)
+    record.add_argument("--upstream", required=True, help="真实服务地址，如 https://dashscope.aliyuncs.com/compatible-mode/v1")
+    record.add_argument("--api-key", default=os.environ.get("DASHSCOPE_API_KEY", ""))
+    record.add_argument("--out", required=True, help="录制输出文件（追加写入）")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        config = FakeLLMConfig(args.ttft, args.tps, args.output_tokens, args.reasoning_tokens,
+                               rate_limit=args.rate_limit, disconnect=args.disconnect, seed=args.seed,
+                               replay=ReplayStore.load(args.replay) if args.replay else None, speed=args.speed)
+        server, base_url = start_server(config, args.host, args.port)
+    else:
+        config = FakeLLMConfig(rate_limit=args.rate_limit, disconnect=args.disconnect, seed=args.seed)
+        server, base_url = start_server(config, args.host, args.port, RecordingHandler,
+                                        upstream=args.upstream, api_key=args.api_key, recorder=Recorder(args.out))
+    print(f"模拟服务已启动：{base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+离线压测：N 个并发模拟会话按应用的真实流程起卦解读
+（起卦 -> 八字 -> 提示词 -> 准入排队 -> 429 退避重试 -> 流式渲染），
+逐级提高并发，找出满足成功率与首字延迟目标的并发上限。
+
+默认在本进程内启动 tools.fake_llm 模拟服务（可注入 429 与流中途断开），
+也可以用 --base-url 指向已在运行的模拟服务或录制回放服务。
+
+    python -m tools.loadtest --levels 4,8,16,32 --sessions 64 --ttft 1 --tps 80 --rate-limit 0.02
+    python -m tools.loadtest --base-url http://127.0.0.1:8765/v1 --levels 8,16 --output load.json
+"""
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+from meihua import bazi, casting, llm_client, rules, scheduler, settings
+from meihua import prompt as prompt_builder
+from meihua.render import StreamRenderer
+
+QUESTIONS = (
+    "近期换工作去北京发展是否顺利？",
+    "这次投资能否获利？",
+    "和对方的感情能否长久？",
+    "下个月的考试能否通过？",
+    "家中老人的身体近期如何？",
+)
+PLACES = ("北京", "上海", "广州", "成都", "")
+OUTCOMES = ("ok", "shed", "queue_timeout", "rate_limited", "disconnected", "error")
+
+
+class _NullBox:
+    """模拟 st.empty()：只计数，不渲染"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def info(self, text, icon=None):
+        self.calls += 1
+
+    def warning(self, text):
+        self.calls += 1
+
+
+def _session_inputs(rng):
+    question = rng.choice(QUESTIONS)
+    if rng.random() < 0.5:
+        res, _ = casting.cast_by_numbers(rng.randint(1, 999), rng.randint(1, 999))
+        verdict = rules.judge_at(res)
+    else:
+        dt = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+        res, _ = casting.cast_by_time(dt.date(), dt.time())
+        verdict = rules.judge_at(res, dt.date())
+    bazi_block = prompt_builder.NO_BAZI_BLOCK
+    if rng.random() < 0.5:
+        birth = datetime.datetime(1950, 1, 1) + datetime.timedelta(minutes=rng.randrange(60 * 365 * 24 * 60))
+        bazi_str, solar_str, solar = bazi.calculate_bazi(birth.year, birth.month, birth.day, birth.hour, birth.minute)
+        bazi_block = prompt_builder.build_bazi_block(bazi.get_bazi_detail(solar), solar_str, bazi_str, rng.choice(PLACES))
+    return prompt_builder.build_messages(question, res, bazi_block, verdict)
+
+
+def _classify(exc):
+    if isinstance(exc, scheduler.QueueFullError):
+        return "shed"
+    if isinstance(exc, scheduler.QueueTimeoutError):
+        return "queue_timeout"
+    if scheduler.is_rate_limited(exc):
+        return "rate_limited"
+    name = type(exc).__name__
+    if "Connection" in name or "Protocol" in name or "Read" in name or "Incomplete" in name:
+        return "disconnected"
+    return "error"
+
+
+def run_session(client, model, messages, sched, thinking_budget):
+    """走一遍应用的解读流程，返回单次会话的记录"""
+    record = {"outcome": "ok", "queue_wait": None, "ttft": None, "total": None, "chunks": 0, "retries": 0}
+    start = time.perf_counter()
+
+    def on_retry(attempt, delay):
+        record["retries"] = attempt
+
+    try:
+        cost = scheduler.estimate_cost(sum(len(m["content"]) for m in messages), thinking_budget)
+        with sched.admit(model, cost):
+            admitted = time.perf_counter()
+            record["queue_wait"] = admitted - start
+            stream = scheduler.stream_with_retry(
+                lambda: llm_client.open_stream(client, model, messages, **llm_client.chat_options(thinking_budget)),
+                model, scheduler=sched, on_retry=on_retry,
+            )
+            renderer = StreamRenderer(_NullBox())
+            for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta
+                    if record["ttft"] is None and (getattr(delta, "content", None)
+                                                   or getattr(delta, "reasoning_content", None)):
+                        record["ttft"] = time.perf_counter() - admitted
+                    if getattr(delta, "content", None):
+                        renderer.write(delta.content)
+            renderer.finish()
+            record["chunks"] = renderer.chunks
+    except Exception as e:
+        record["outcome"] = _classify(e)
+        record["error"] = f"{type(e).__name__}: {e}"[:200]
+    record["total"] = time.perf_counter() - start
+    return record
+
+
+def _pct(values, p):
+    return round(float(np.percentile(values, p)), 4) if values else None
+
+
+def run_level(client, model, concurrency, sessions, thinking_budget, seed, queue_max=None, queue_timeout=None):
+    """concurrency 个工作线程闭环执行共 sessions 次会话，每级使用独立的准入调度器"""
+    sched = scheduler.AdmissionScheduler(queue_max=queue_max, queue_timeout=queue_timeout)
+    records = []
+    lock = threading.Lock()
+    remaining = [sessions]
+
+    def worker(idx):
+        rng = random.Random(seed * 1000 + idx)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            rec = run_session(client, model, _session_inputs(rng), sched, thinking_budget)
+            with lock:
+                records.append(rec)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    wall = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall
+
+    ok = [r for r in records if r["outcome"] == "ok"]
+    waits = [r["queue_wait"] for r in records if r["queue_wait"] is not None]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    return {
+        "concurrency": concurrency, "sessions": len(records), "wall_seconds": round(wall, 3),
+        "throughput": round(len(ok) / wall, 3) if wall else None,
+        "success_rate": round(len(ok) / len(records), 4) if records else 0.0,
+        "outcomes": {o: sum(1 for r in records if r["outcome"] == o) for o in OUTCOMES},
+        "retries": sum(r["retries"] for r in records),
+        "queue_wait_p50": _pct(waits, 50), "queue_wait_p95": _pct(waits, 95),
+        "ttft_p50": _pct(ttfts, 50), "ttft_p95": _pct(ttfts, 95),
+        "total_p50": _pct([r["total"] for r in ok], 50), "total_p95": _pct([r["total"] for r in ok], 95),
+        "chunks_mean": round(float(np.mean([r["chunks"] for r in ok])), 1) if ok else 0,
+        "errors": sorted({r["error"] for r in records if "error" in r})[:5],
+        "scheduler": sched.stats().get(model, {}),
+    }
+
+
+def ceiling(levels, min_success, max_ttft_p95):
+    """满足成功率与首字延迟 P95 目标的最高并发级别"""
+    best = None
+    for level in levels:
+        ttft_ok = level["ttft_p95"] is not None and level["ttft_p95"] <= max_ttft_p95
+        if level["success_rate"] >= min_success and ttft_ok:
+            best = level["concurrency"]
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线压测：寻找并发上限")
+    parser.add_argument("--levels", default="2,4,8,16", help="逗号分隔的并发级别")
+    parser.add_argument("--sessions", type=int, default=32, help="每个级别的会话总数")
+    parser.add_argument("--model", default="qwen-plus")
+    parser.add_argument("--thinking-budget", type=int, default=settings.LLM_THINKING_BUDGET)
+    parser.add_argument("--queue-max", type=int, help="覆盖 MEIHUA_LLM_QUEUE_MAX")
+    parser.add_argument("--queue-timeout", type=float, help="覆盖 MEIHUA_LLM_QUEUE_TIMEOUT")
+    parser.add_argument("--min-success", type=float, default=0.99)
+    parser.add_argument("--max-ttft-p95", type=float, default=10.0, help="入队后首字延迟 P95 目标（秒）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    parser.add_argument("--base-url", help="已运行的模拟服务地址；不填则在本进程内启动")
+    parser.add_argument("--api-key", default="sk-fake")
+    fake = parser.add_argument_group("内置模拟服务")
+    fake.add_argument("--ttft", type=float, default=0.5)
+    fake.add_argument("--tps", type=float, default=80.0)
+    fake.add_argument("--output-tokens", type=int, default=300)
+    fake.add_argument("--reasoning-tokens", type=int, default=0)
+    fake.add_argument("--rate-limit", type=float, default=0.0)
+    fake.add_argument("--disconnect", type=float, default=0.0)
+    fake.add_argument("--replay", help="录制文件，按录制内容回放")
+    fake.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        from tools.fake_llm import FakeLLMConfig, ReplayStore, start_server
+
+        config = FakeLLMConfig(args.ttft, args.tps, args.output_tokens, args.reasoning_tokens,
+                               rate_limit=args.rate_limit, disconnect=args.disconnect, seed=args.seed,
+                               replay=ReplayStore.load(args.replay) if args.replay else None, speed=args.speed)
+        server, base_url = start_server(config)
+    try:
+        client = llm_client.get_client(args.api_key, base_url)
+        levels = []
+        for concurrency in [int(x) for x in args.levels.split(",") if x.strip()]:
+            level = run_level(client, args.model, concurrency, args.sessions, args.thinking_budget, args.seed,
+                              args.queue_max, args.queue_timeout)
+            levels.append(level)
+            print(f"并发 {concurrency:4d}: 成功率 {level['success_rate']:.1%}  吞吐 {level['throughput']}/s  "
+                  f"排队 P95 {level['queue_wait_p95']}s  首字 P95 {level['ttft_p95']}s  {level['outcomes']}")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    result = {
+        "base_url": base_url, "model": args.model, "stream_limit": llm_client.model_stream_limit(args.model),
+        "levels": levels, "ceiling": ceiling(levels, args.min_success, args.max_ttft_p95),
+    }
+    print(f"并发上限：{result['ceiling']}（成功率 >= {args.min_success:.0%}，首字 P95 <= {args.max_ttft_p95}s）")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()